@@ -1,9 +1,11 @@
 from sqlalchemy import (
-    create_engine, Column, Integer, Text, DateTime, Date, Float, ForeignKey,
-    event, inspect as sa_inspect, text as sa_text
+    create_engine, Column, Integer, Text, DateTime, Date, Float, ForeignKey, Index,
+    delete, event, insert, select, inspect as sa_inspect, text as sa_text
 )
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
 from datetime import datetime, date
+import functools
 import logging
 import os
 from dotenv import load_dotenv
@@ -17,6 +19,10 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./shift_scheduler.db")
 # Railway provides postgres:// but SQLAlchemy requires postgresql://
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# requirements.txt installs psycopg2; name it explicitly since newer SQLAlchemy
+# defaults postgresql:// to psycopg 3
+if DATABASE_URL.startswith("postgresql://"):
+    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
 
 _is_sqlite = DATABASE_URL.startswith("sqlite")
 
@@ -24,8 +30,43 @@ _is_sqlite = DATABASE_URL.startswith("sqlite")
 _engine_kwargs = {}
 if _is_sqlite:
     _engine_kwargs["connect_args"] = {"check_same_thread": False}
+else:
+    if os.getenv("SQLALCHEMY_NULLPOOL", "").lower() in ("1", "true", "yes"):
+        # Behind PgBouncer: let the bouncer multiplex connections and don't
+        # keep a second pool in the app
+        _engine_kwargs["poolclass"] = NullPool
+    else:
+        # PostgreSQL: size the pool explicitly, bound the checkout wait and
+        # recycle long-lived connections
+        _engine_kwargs.update(
+            pool_size=int(os.getenv("SQLALCHEMY_POOL_SIZE", "20")),
+            max_overflow=int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", "10")),
+            pool_timeout=int(os.getenv("SQLALCHEMY_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("SQLALCHEMY_POOL_RECYCLE", "1800")),
+        )
+    # Ping before checkout so connections dropped by Railway don't surface as errors
+    _engine_kwargs.update(
+        pool_pre_ping=True,
+        # TCP keepalives let psycopg2 detect dead sockets instead of hanging
+        connect_args={
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 5,
+        },
+    )
+    if DATABASE_URL.startswith("postgresql+psycopg2://"):
+        # Batch executemany() calls: INSERTs become multi-row VALUES pages and
+        # UPDATE/DELETE use execute_batch, instead of one round trip per row
+        _engine_kwargs.update(
+            executemany_mode="values_plus_batch",
+            insertmanyvalues_page_size=1000,
+            executemany_batch_page_size=500,
+        )
 
-engine = create_engine(DATABASE_URL, **_engine_kwargs)
+# Larger compiled-statement cache (default 500) so the ORM query shapes used by
+# the routers stay compiled across requests
+engine = create_engine(DATABASE_URL, query_cache_size=1200, **_engine_kwargs)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -37,6 +78,12 @@ if _is_sqlite:
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA journal_mode=WAL")
         cursor.execute("PRAGMA foreign_keys=ON")
+        # WAL + NORMAL only fsyncs at checkpoints; still safe against app crashes
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB memory-mapped I/O
+        cursor.execute("PRAGMA busy_timeout=5000")
         cursor.close()
 
 
@@ -48,6 +95,41 @@ def get_db():
         db.close()
 
 
+# ---- Data version ----
+# Bumped after every commit that wrote something, so read caches (e.g. export
+# data) can key on it and never serve data older than the last write.
+
+_data_version = 0
+
+
+def get_data_version() -> int:
+    return _data_version
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _track_statement_writes(orm_execute_state):
+    # Core/ORM bulk INSERT/UPDATE/DELETE issued through session.execute()
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["has_writes"] = True
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_flush_writes(session, flush_context):
+    session.info["has_writes"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_data_version(session):
+    global _data_version
+    if session.info.pop("has_writes", False):
+        _data_version += 1
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _reset_write_flag(session):
+    session.info.pop("has_writes", None)
+
+
 # ---- ORM Models ----
 
 class Employee(Base):
@@ -73,6 +155,9 @@ class JobType(Base):
 
 class EmployeeJobType(Base):
     __tablename__ = "employee_job_types"
+    __table_args__ = (
+        Index("ix_employee_job_types_employee_id", "employee_id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     employee_id = Column(Integer, ForeignKey("employees.id", ondelete="CASCADE"), nullable=False)
     job_type_id = Column(Integer, ForeignKey("job_types.id"), nullable=False)
@@ -83,6 +168,10 @@ class EmployeeJobType(Base):
 
 class ShiftRequest(Base):
     __tablename__ = "shift_requests"
+    __table_args__ = (
+        Index("ix_shift_requests_target_month", "target_month"),
+        Index("ix_shift_requests_employee_month", "employee_id", "target_month"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     employee_id = Column(Integer, ForeignKey("employees.id", ondelete="CASCADE"), nullable=False)
     target_month = Column(Text, nullable=False)
@@ -95,6 +184,9 @@ class ShiftRequest(Base):
 
 class RequestDetail(Base):
     __tablename__ = "request_details"
+    __table_args__ = (
+        Index("ix_request_details_request_id", "shift_request_id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     shift_request_id = Column(Integer, ForeignKey("shift_requests.id", ondelete="CASCADE"), nullable=False)
     date = Column(Date, nullable=False)
@@ -105,6 +197,11 @@ class RequestDetail(Base):
 
 class DailyRequirement(Base):
     __tablename__ = "daily_requirements"
+    __table_args__ = (
+        # One requirement per day and job type; conflict target of the bulk UPSERT.
+        # Its leading date column also serves the month range scans
+        Index("ux_daily_requirements_date_job_type", "date", "job_type_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     date = Column(Date, nullable=False)
     job_type_id = Column(Integer, ForeignKey("job_types.id"), nullable=False)
@@ -115,6 +212,9 @@ class DailyRequirement(Base):
 
 class Schedule(Base):
     __tablename__ = "schedules"
+    __table_args__ = (
+        Index("ix_schedules_target_month", "target_month"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     target_month = Column(Text, nullable=False)
     status = Column(Text, nullable=False, default="draft")
@@ -127,6 +227,16 @@ class Schedule(Base):
 
 class ShiftAssignment(Base):
     __tablename__ = "shift_assignments"
+    __table_args__ = (
+        Index("ix_shift_assignments_employee_id", "employee_id"),
+        # Covers per-schedule reads (assignments, reports, exports, the pin
+        # copy) so PostgreSQL can answer them with index-only scans
+        Index(
+            "ix_shift_assignments_schedule_employee_date",
+            "schedule_id", "employee_id", "date",
+            postgresql_include=["job_type_id", "work_type", "headcount_value"],
+        ),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     schedule_id = Column(Integer, ForeignKey("schedules.id", ondelete="CASCADE"), nullable=False)
     employee_id = Column(Integer, ForeignKey("employees.id", ondelete="CASCADE"), nullable=False)
@@ -152,85 +262,132 @@ class NlpModificationLog(Base):
     schedule = relationship("Schedule", back_populates="nlp_logs")
 
 
-def _get_existing_columns(table_name: str) -> list[str]:
+@functools.lru_cache(maxsize=1)
+def _get_inspector():
+    """Shared Inspector for startup schema checks.
+
+    Reflection results are cached on the Inspector, so it describes the
+    schema as first seen; init_db clears it once migrations are done.
+    """
+    return sa_inspect(engine)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_existing_columns(table_name: str) -> tuple[str, ...]:
     """Get existing column names for a table using SQLAlchemy inspect."""
     try:
-        inspector = sa_inspect(engine)
+        inspector = _get_inspector()
         if table_name not in inspector.get_table_names():
-            return []
-        return [col["name"] for col in inspector.get_columns(table_name)]
+            return ()
+        return tuple(col["name"] for col in inspector.get_columns(table_name))
     except Exception:
-        return []
+        return ()
 
 
-def _migrate_add_period_column():
-    """Add period column to request_details if it doesn't exist."""
-    try:
-        columns = _get_existing_columns("request_details")
-        if columns and "period" not in columns:
-            with engine.begin() as conn:
-                conn.execute(sa_text(
-                    "ALTER TABLE request_details ADD COLUMN period TEXT NOT NULL DEFAULT 'all_day'"
-                ))
-    except Exception:
-        pass  # Table may not exist yet
+def _clear_schema_cache():
+    _get_existing_columns.cache_clear()
+    _get_inspector.cache_clear()
 
 
-def _migrate_add_employment_type():
-    """Add employment_type column to employees if it doesn't exist."""
-    try:
-        columns = _get_existing_columns("employees")
-        if columns and "employment_type" not in columns:
-            with engine.begin() as conn:
-                conn.execute(sa_text(
-                    "ALTER TABLE employees ADD COLUMN employment_type TEXT NOT NULL DEFAULT 'full_time'"
-                ))
-    except Exception:
-        pass  # Table may not exist yet
+# Indexes superseded by newer ones; dropped from existing databases
+_DROPPED_INDEXES = (
+    ("daily_requirements", "ix_daily_requirements_date"),  # covered by the unique index
+    ("shift_assignments", "ix_shift_assignments_schedule_date"),  # covered by the schedule/employee/date index
+)
 
 
-def _migrate_work_days_to_text():
-    """Convert requested_work_days from integer to text in shift_requests."""
-    if not _is_sqlite:
-        return  # PostgreSQL text columns don't need this migration
-    try:
-        columns = _get_existing_columns("shift_requests")
-        if columns and "requested_work_days" in columns:
-            with engine.begin() as conn:
-                conn.execute(sa_text(
-                    "UPDATE shift_requests SET requested_work_days = CAST(requested_work_days AS TEXT) "
-                    "WHERE requested_work_days IS NOT NULL AND typeof(requested_work_days) != 'text'"
-                ))
-    except Exception:
-        pass  # Table may not exist yet
+def _migrate_schema():
+    """Bring tables created by older versions up to date.
 
+    Column changes run in one transaction and abort startup if they fail,
+    since every ORM query selects those columns:
+      - request_details.period
+      - employees.employment_type
+      - shift_requests.requested_work_days integer -> text (SQLite only)
+      - employees.sort_order (backfilled from id order)
 
-def _migrate_add_sort_order():
-    """Add sort_order column to employees if it doesn't exist."""
-    try:
-        columns = _get_existing_columns("employees")
-        if columns and "sort_order" not in columns:
+    Index work follows in separate transactions, so a failed index cannot
+    roll back the columns; each failure is logged and startup continues:
+      - daily_requirements duplicates removed before its unique index
+      - superseded indexes dropped (_DROPPED_INDEXES)
+      - indexes declared on the models, one transaction each
+    """
+    rd_cols = set(_get_existing_columns("request_details"))
+    emp_cols = set(_get_existing_columns("employees"))
+    sr_cols = set(_get_existing_columns("shift_requests"))
+    with engine.begin() as conn:
+        if rd_cols and "period" not in rd_cols:
+            conn.execute(sa_text(
+                "ALTER TABLE request_details ADD COLUMN period TEXT NOT NULL DEFAULT 'all_day'"
+            ))
+        if emp_cols and "employment_type" not in emp_cols:
+            conn.execute(sa_text(
+                "ALTER TABLE employees ADD COLUMN employment_type TEXT NOT NULL DEFAULT 'full_time'"
+            ))
+        # PostgreSQL text columns don't need this migration
+        if _is_sqlite and "requested_work_days" in sr_cols:
+            conn.execute(sa_text(
+                "UPDATE shift_requests SET requested_work_days = CAST(requested_work_days AS TEXT) "
+                "WHERE requested_work_days IS NOT NULL AND typeof(requested_work_days) != 'text'"
+            ))
+        if emp_cols and "sort_order" not in emp_cols:
+            conn.execute(sa_text(
+                "ALTER TABLE employees ADD COLUMN sort_order INTEGER NOT NULL DEFAULT 0"
+            ))
+            # Assign sort_order based on existing id order (single set-based
+            # UPDATE; the correlated subquery works on SQLite and PostgreSQL)
+            conn.execute(sa_text(
+                "UPDATE employees SET sort_order = "
+                "(SELECT COUNT(*) FROM employees e2 WHERE e2.id < employees.id)"
+            ))
+
+    # create_all only builds indexes for tables it creates
+    inspector = _get_inspector()
+    existing_tables = set(inspector.get_table_names())
+    if "daily_requirements" in existing_tables and "ux_daily_requirements_date_job_type" not in {
+        ix["name"] for ix in inspector.get_indexes("daily_requirements")
+    }:
+        # Drop duplicate (date, job_type_id) rows before the unique index
+        # is built; keep the oldest row, which the old upsert updated
+        try:
             with engine.begin() as conn:
                 conn.execute(sa_text(
-                    "ALTER TABLE employees ADD COLUMN sort_order INTEGER NOT NULL DEFAULT 0"
+                    "DELETE FROM daily_requirements WHERE id NOT IN "
+                    "(SELECT MIN(id) FROM daily_requirements GROUP BY date, job_type_id)"
                 ))
-                # Assign sort_order based on existing id order
-                rows = conn.execute(sa_text("SELECT id FROM employees ORDER BY id")).fetchall()
-                for idx, row in enumerate(rows):
-                    conn.execute(sa_text(
-                        "UPDATE employees SET sort_order = :idx WHERE id = :id"
-                    ), {"idx": idx, "id": row[0]})
-    except Exception:
-        pass  # Table may not exist yet
+        except Exception:
+            logger.warning("daily_requirements の重複行削除に失敗しました", exc_info=True)
+    for table_name, index_name in _DROPPED_INDEXES:
+        if table_name not in existing_tables:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(sa_text(f"DROP INDEX IF EXISTS {index_name}"))
+        except Exception:
+            logger.warning("インデックス %s の削除に失敗しました", index_name, exc_info=True)
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            try:
+                with engine.begin() as conn:
+                    index.create(bind=conn)
+            except Exception:
+                logger.warning("インデックス %s の作成に失敗しました", index.name, exc_info=True)
 
 
 def init_db():
     """Create tables and seed initial data."""
+    # A brand-new database gets the current schema from create_all; only
+    # pre-existing tables need migrating
+    fresh = not _get_inspector().get_table_names()
     Base.metadata.create_all(bind=engine)
-    _migrate_add_period_column()
-    _migrate_add_employment_type()
-    _migrate_work_days_to_text()
-    _migrate_add_sort_order()
+    if not fresh:
+        _migrate_schema()
+    _clear_schema_cache()
     db = SessionLocal()
     try:
         if db.query(JobType).count() == 0:
@@ -262,13 +419,21 @@ def init_db():
                 ("大野千絵美", "full_time", ["職人", "サブ職人", "データ", "その他"]),
             ]
             jt_map = {jt.name: jt.id for jt in db.query(JobType).all()}
-            for idx, (name, emp_type, jt_names) in enumerate(seed_data):
-                emp = Employee(name=name, employment_type=emp_type, sort_order=idx)
-                db.add(emp)
-                db.flush()
-                for jt_name in jt_names:
-                    if jt_name in jt_map:
-                        db.add(EmployeeJobType(employee_id=emp.id, job_type_id=jt_map[jt_name]))
+            # スタッフと担当業務をそれぞれ1回の executemany INSERT で投入する
+            emp_ids = db.scalars(
+                insert(Employee).returning(Employee.id, sort_by_parameter_order=True),
+                [
+                    {"name": name, "employment_type": emp_type, "sort_order": idx}
+                    for idx, (name, emp_type, _) in enumerate(seed_data)
+                ],
+            ).all()
+            join_rows = [
+                {"employee_id": emp_id, "job_type_id": jt_map[jt_name]}
+                for emp_id, (_, _, jt_names) in zip(emp_ids, seed_data)
+                for jt_name in jt_names
+                if jt_name in jt_map
+            ]
+            db.execute(insert(EmployeeJobType), join_rows)
             db.commit()
     finally:
         db.close()
@@ -277,8 +442,8 @@ def init_db():
 def cleanup_old_schedules(db: Session | None = None) -> int:
     """13ヶ月より古いスケジュールと関連データを削除する。
 
-    カスケード削除により ShiftAssignment, NlpModificationLog,
-    RequestDetail も自動的に削除される。
+    一括 DELETE 文で削除し、ShiftAssignment, NlpModificationLog,
+    RequestDetail は DB の ON DELETE CASCADE により削除される。
     """
     close_after = False
     if db is None:
@@ -294,32 +459,30 @@ def cleanup_old_schedules(db: Session | None = None) -> int:
             cutoff_year -= 1
         cutoff_str = f"{cutoff_year:04d}-{cutoff_month:02d}"
 
-        # 古いスケジュールを削除（ShiftAssignment, NlpModificationLog はカスケード削除）
-        old_schedules = (
-            db.query(Schedule)
-            .filter(Schedule.target_month < cutoff_str)
-            .all()
-        )
-        schedule_count = len(old_schedules)
-        if schedule_count > 0:
-            deleted_months = sorted(set(s.target_month for s in old_schedules))
-            for schedule in old_schedules:
-                db.delete(schedule)
+        # 古いスケジュールを削除（ShiftAssignment, NlpModificationLog は DB 側でカスケード削除）
+        deleted_months = db.scalars(
+            select(Schedule.target_month)
+            .where(Schedule.target_month < cutoff_str)
+            .distinct()
+            .order_by(Schedule.target_month)
+        ).all()
+        schedule_count = 0
+        if deleted_months:
+            schedule_count = db.execute(
+                delete(Schedule).where(Schedule.target_month < cutoff_str),
+                execution_options={"synchronize_session": False},
+            ).rowcount
             logger.info(
                 "保管期限クリーンアップ: %d件のスケジュールを削除 (対象月: %s)",
                 schedule_count, ", ".join(deleted_months),
             )
 
-        # 古いシフト希望を削除（RequestDetail はカスケード削除）
-        old_requests = (
-            db.query(ShiftRequest)
-            .filter(ShiftRequest.target_month < cutoff_str)
-            .all()
-        )
-        request_count = len(old_requests)
+        # 古いシフト希望を削除（RequestDetail は DB 側でカスケード削除）
+        request_count = db.execute(
+            delete(ShiftRequest).where(ShiftRequest.target_month < cutoff_str),
+            execution_options={"synchronize_session": False},
+        ).rowcount
         if request_count > 0:
-            for req in old_requests:
-                db.delete(req)
             logger.info(
                 "保管期限クリーンアップ: %d件のシフト希望を削除", request_count,
             )
@@ -1,9 +1,14 @@
+import logging
 import os
+import threading
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from database import init_db, cleanup_old_schedules
 from routers import employees, job_types, requests, requirements, schedules, nlp_modify, reports, export, holidays
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Shift Scheduler API", version="1.0.0")
 
 # CORS: allow frontend origins (local + Vercel + FRONTEND_URL)
@@ -23,32 +28,70 @@ if os.getenv("FRONTEND_URL"):
 # Regex for Vercel deployments (*.vercel.app)
 allow_origin_regex = r"https://.*\.vercel\.app"
 
+# Only the methods/headers the API actually uses (frontend/lib/api.ts sends JSON)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,
+    allow_origins=tuple(allowed_origins),
     allow_origin_regex=allow_origin_regex,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Content-Type"],
 )
 
-app.include_router(employees.router)
-app.include_router(job_types.router)
-app.include_router(requests.router)
-app.include_router(requirements.router)
-app.include_router(schedules.router)
-app.include_router(nlp_modify.router)
-app.include_router(reports.router)
-app.include_router(export.router)
-app.include_router(holidays.router)
+_routers = [
+    employees.router,
+    job_types.router,
+    requests.router,
+    requirements.router,
+    schedules.router,
+    nlp_modify.router,
+    reports.router,
+    export.router,
+    holidays.router,
+]
+
+# Fail fast if the same path/method is ever registered twice (e.g. a duplicated
+# router module): the second copy would never match and every request would pay
+# for the extra route checks.
+_route_keys = [
+    (route.path, method)
+    for router in _routers
+    for route in router.routes
+    for method in getattr(route, "methods", None) or ()
+]
+_duplicate_routes = sorted({key for key in _route_keys if _route_keys.count(key) > 1})
+if _duplicate_routes:
+    raise RuntimeError(f"Duplicate routes registered: {_duplicate_routes}")
+
+for _router in _routers:
+    app.include_router(_router)
+
+
+def _cleanup_in_background():
+    try:
+        cleanup_old_schedules()
+    except Exception:
+        # cleanup_old_schedules logs its own query failures; this catches the
+        # rest (e.g. session setup) so the thread doesn't die silently
+        logger.exception("保管期限クリーンアップのスレッドでエラーが発生しました")
+
+
+@app.on_event("startup")
+async def configure_threadpool():
+    # Handlers are sync (blocking SQLAlchemy sessions) and each in-flight request
+    # holds a worker thread, so the default limit of 40 stalls under load while
+    # long solves/exports run. Size it explicitly.
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("API_THREADPOOL_SIZE", "100"))
 
 
 @app.on_event("startup")
 def on_startup():
     init_db()
-    cleanup_old_schedules()
+    # Retention cleanup is not user-facing; don't hold up startup on it
+    threading.Thread(target=_cleanup_in_background, name="cleanup-old-schedules", daemon=True).start()
 
 
 @app.get("/api/health")
-def health():
+async def health():
     return {"status": "ok"}
@@ -126,6 +126,11 @@ class ShiftAssignmentUpdate(BaseModel):
 class ScheduleGenerate(BaseModel):
     month: str
 
+class ScheduleGenerateOut(BaseModel):
+    schedule_id: int
+    assignment_count: int
+    violations: list[str] = []
+
 class StatusUpdate(BaseModel):
     status: str
 
@@ -135,11 +140,19 @@ class StatusUpdate(BaseModel):
 class NlpModifyRequest(BaseModel):
     input_text: str
 
+class NlpChangeOut(BaseModel):
+    employee_id: int
+    employee_name: str = ""
+    date: str
+    old_job_type: str
+    new_job_type: str
+
 class NlpModifyResponse(BaseModel):
     log_id: int
-    parsed_instruction: Optional[str] = None
-    preview_assignments: list[ShiftAssignmentOut] = []
-    changes: list[dict] = []
+    new_schedule_id: int
+    parsed_instruction: list[dict] = []
+    changes: list[NlpChangeOut] = []
+    violations: list[str] = []
 
 class NlpLogOut(BaseModel):
     id: int
@@ -1,29 +1,107 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import func
+from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.orm import Session
 from database import get_db, Employee, EmployeeJobType, JobType
 from models import EmployeeCreate, EmployeeUpdate, EmployeeOut, EmployeeJobTypesUpdate, EmployeeFullUpdate, EmployeeReorder, JobTypeOut
 
 router = APIRouter(prefix="/api/employees", tags=["employees"])
 
+# GET /api/employees の結果をプロセス内にキャッシュする。キーはバージョン番号で、
+# スタッフ・担当業務を書き換えるエンドポイントは invalidate_employees() を呼ぶこと。
+_EMP_CACHE: dict[int, list[dict]] = {}
+_EMP_VERSION = 0
+
+
+def invalidate_employees() -> None:
+    """スタッフ一覧キャッシュを無効化する。"""
+    global _EMP_VERSION
+    _EMP_VERSION += 1
+    _EMP_CACHE.clear()
+
+
+def _list_employees(db: Session) -> list[dict]:
+    """スタッフ一覧を担当業務付きで返す。
+
+    Employee → EmployeeJobType → JobType を外部結合した1本のクエリで
+    フラットな行を取得し、ORM オブジェクトを作らずに1パスで組み立てる。
+    """
+    rows = db.execute(
+        select(
+            Employee.id, Employee.name, Employee.employment_type, Employee.sort_order,
+            JobType.id, JobType.name, JobType.color,
+        )
+        .select_from(Employee)
+        .outerjoin(EmployeeJobType, EmployeeJobType.employee_id == Employee.id)
+        .outerjoin(JobType, JobType.id == EmployeeJobType.job_type_id)
+        .order_by(Employee.sort_order, Employee.id, EmployeeJobType.id)
+    ).all()
+
+    result: dict[int, dict] = {}
+    for emp_id, name, emp_type, sort_order, jt_id, jt_name, jt_color in rows:
+        emp = result.get(emp_id)
+        if emp is None:
+            emp = result[emp_id] = {
+                "id": emp_id,
+                "name": name,
+                "employment_type": emp_type or "full_time",
+                "sort_order": sort_order,
+                "job_types": [],
+            }
+        if jt_id is not None:
+            emp["job_types"].append({"id": jt_id, "name": jt_name, "color": jt_color})
+    return list(result.values())
+
 
 def _employee_to_out(emp: Employee) -> EmployeeOut:
-    return EmployeeOut(
+    # DB の値をそのまま詰めるだけなので model_construct で検証を省略する
+    # （レスポンスは response_model で1回だけ検証される）
+    return EmployeeOut.model_construct(
         id=emp.id,
         name=emp.name,
         employment_type=emp.employment_type or "full_time",
         sort_order=emp.sort_order,
         job_types=[
-            JobTypeOut(id=ejt.job_type.id, name=ejt.job_type.name, color=ejt.job_type.color)
+            JobTypeOut.model_construct(id=ejt.job_type.id, name=ejt.job_type.name, color=ejt.job_type.color)
             for ejt in emp.job_types
         ],
     )
 
 
+def _replace_job_types(db: Session, employee_id: int, job_type_ids: list[int]) -> None:
+    """担当可能な仕事種類を入れ替える（存在確認は IN 1回、挿入は executemany 1回）。"""
+    # 同じ仕事種類が重複して送られても1行だけ登録する（順序は維持）
+    job_type_ids = list(dict.fromkeys(job_type_ids))
+    valid_ids = set(db.scalars(select(JobType.id).where(JobType.id.in_(job_type_ids))))
+    missing = sorted(set(job_type_ids) - valid_ids)
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"JobType {', '.join(map(str, missing))} not found",
+        )
+
+    # 直後にコミットして emp を refresh するので、セッション内の同期は不要
+    db.execute(
+        delete(EmployeeJobType).where(EmployeeJobType.employee_id == employee_id),
+        execution_options={"synchronize_session": False},
+    )
+    if job_type_ids:
+        db.execute(
+            insert(EmployeeJobType),
+            [{"employee_id": employee_id, "job_type_id": jt_id} for jt_id in job_type_ids],
+        )
+
+
 @router.get("", response_model=list[EmployeeOut])
 def list_employees(db: Session = Depends(get_db)):
-    employees = db.query(Employee).order_by(Employee.sort_order).all()
-    return [_employee_to_out(e) for e in employees]
+    version = _EMP_VERSION
+    cached = _EMP_CACHE.get(version)
+    if cached is not None:
+        return cached
+    result = _list_employees(db)
+    # 取得中に書き込みがあった場合は古い結果を保存しない
+    if version == _EMP_VERSION:
+        _EMP_CACHE[version] = result
+    return result
 
 
 @router.post("", response_model=EmployeeOut, status_code=201)
@@ -32,6 +110,7 @@ def create_employee(body: EmployeeCreate, db: Session = Depends(get_db)):
     emp = Employee(name=body.name, employment_type=body.employment_type, sort_order=max_order + 1)
     db.add(emp)
     db.commit()
+    invalidate_employees()
     db.refresh(emp)
     return _employee_to_out(emp)
 
@@ -39,34 +118,43 @@ def create_employee(body: EmployeeCreate, db: Session = Depends(get_db)):
 @router.put("/reorder", response_model=list[EmployeeOut])
 def reorder_employees(body: EmployeeReorder, db: Session = Depends(get_db)):
     """スタッフの表示順を一括更新する。"""
-    for idx, emp_id in enumerate(body.employee_ids):
-        emp = db.query(Employee).filter(Employee.id == emp_id).first()
-        if emp:
-            emp.sort_order = idx
+    # 存在しないIDは除外し、残りを1回の executemany UPDATE で更新する
+    existing_ids = set(
+        db.scalars(select(Employee.id).where(Employee.id.in_(body.employee_ids)))
+    )
+    rows = [
+        {"id": emp_id, "sort_order": idx}
+        for idx, emp_id in enumerate(body.employee_ids)
+        if emp_id in existing_ids
+    ]
+    if rows:
+        db.execute(update(Employee), rows)
     db.commit()
-    employees = db.query(Employee).order_by(Employee.sort_order).all()
-    return [_employee_to_out(e) for e in employees]
+    invalidate_employees()
+    return _list_employees(db)
 
 
 @router.put("/{employee_id}", response_model=EmployeeOut)
 def update_employee(employee_id: int, body: EmployeeUpdate, db: Session = Depends(get_db)):
-    emp = db.query(Employee).filter(Employee.id == employee_id).first()
+    emp = db.get(Employee, employee_id)
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
     emp.name = body.name
     emp.employment_type = body.employment_type
     db.commit()
+    invalidate_employees()
     db.refresh(emp)
     return _employee_to_out(emp)
 
 
 @router.delete("/{employee_id}", status_code=204)
 def delete_employee(employee_id: int, db: Session = Depends(get_db)):
-    emp = db.query(Employee).filter(Employee.id == employee_id).first()
+    emp = db.get(Employee, employee_id)
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
     db.delete(emp)
     db.commit()
+    invalidate_employees()
 
 
 @router.put("/{employee_id}/full", response_model=EmployeeOut)
@@ -74,24 +162,16 @@ def update_employee_full(
     employee_id: int, body: EmployeeFullUpdate, db: Session = Depends(get_db)
 ):
     """属性・担当可能な仕事種類を1トランザクションで一括保存する。"""
-    emp = db.query(Employee).filter(Employee.id == employee_id).first()
+    emp = db.get(Employee, employee_id)
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
 
     emp.name = body.name
     emp.employment_type = body.employment_type
-
-    # Delete existing job types
-    db.query(EmployeeJobType).filter(EmployeeJobType.employee_id == employee_id).delete()
-
-    # Insert new job types
-    for jt_id in body.job_type_ids:
-        jt = db.query(JobType).filter(JobType.id == jt_id).first()
-        if not jt:
-            raise HTTPException(status_code=400, detail=f"JobType {jt_id} not found")
-        db.add(EmployeeJobType(employee_id=employee_id, job_type_id=jt_id))
+    _replace_job_types(db, employee_id, body.job_type_ids)
 
     db.commit()
+    invalidate_employees()
     db.refresh(emp)
     return _employee_to_out(emp)
 
@@ -100,20 +180,13 @@ def update_employee_full(
 def update_employee_job_types(
     employee_id: int, body: EmployeeJobTypesUpdate, db: Session = Depends(get_db)
 ):
-    emp = db.query(Employee).filter(Employee.id == employee_id).first()
+    emp = db.get(Employee, employee_id)
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
 
-    # Delete existing
-    db.query(EmployeeJobType).filter(EmployeeJobType.employee_id == employee_id).delete()
-
-    # Insert new
-    for jt_id in body.job_type_ids:
-        jt = db.query(JobType).filter(JobType.id == jt_id).first()
-        if not jt:
-            raise HTTPException(status_code=400, detail=f"JobType {jt_id} not found")
-        db.add(EmployeeJobType(employee_id=employee_id, job_type_id=jt_id))
+    _replace_job_types(db, employee_id, body.job_type_ids)
 
     db.commit()
+    invalidate_employees()
     db.refresh(emp)
     return _employee_to_out(emp)
@@ -1,46 +1,82 @@
+from collections.abc import Callable, Iterator
+from typing import BinaryIO
+from tempfile import SpooledTemporaryFile
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from database import get_db
-from services.export_service import generate_csv, generate_excel, generate_pdf
+from services.export_service import iter_csv_rows, generate_excel, generate_pdf
 
 router = APIRouter(prefix="/api/export", tags=["export"])
 
+_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+# Handlers here stay plain `def`: FastAPI runs them in the worker threadpool
+# (sized by API_THREADPOOL_SIZE), so the CPU-bound Excel/PDF rendering never
+# blocks the event loop, and the request-scoped session stays on one thread.
+
 
 @router.get("/csv")
 def export_csv(month: str, db: Session = Depends(get_db)):
     try:
-        content = generate_csv(db, month)
-        return Response(
-            content=content.encode("utf-8-sig"),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=shift_{month}.csv"},
-        )
+        rows = iter_csv_rows(db, month)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    return StreamingResponse(
+        rows,
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename=shift_{month}.csv"},
+    )
 
 
-@router.get("/excel")
-def export_excel(month: str, db: Session = Depends(get_db)):
+def _spooled_response(
+    write: Callable[[BinaryIO], None], media_type: str, filename: str,
+) -> StreamingResponse:
+    """Render into a spooled temp file (RAM up to 8MB, then disk) and stream it out."""
+    tmp = SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
     try:
-        content = generate_excel(db, month)
-        return Response(
-            content=content,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=shift_{month}.xlsx"},
-        )
+        write(tmp)
     except ValueError as e:
+        tmp.close()
         raise HTTPException(status_code=404, detail=str(e))
+    size = tmp.tell()
+    tmp.seek(0)
+    # The iterator closes the file once drained; the background task also
+    # covers responses whose body iteration never starts. close() is idempotent
+    return StreamingResponse(
+        _iter_file(tmp),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(size),
+        },
+        background=BackgroundTask(tmp.close),
+    )
+
+
+def _iter_file(f: BinaryIO) -> Iterator[bytes]:
+    try:
+        while chunk := f.read(_CHUNK_SIZE):
+            yield chunk
+    finally:
+        f.close()
+
+
+@router.get("/excel")
+def export_excel(month: str, db: Session = Depends(get_db)):
+    return _spooled_response(
+        lambda out: generate_excel(db, month, out),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"shift_{month}.xlsx",
+    )
 
 
 @router.get("/pdf")
 def export_pdf(month: str, db: Session = Depends(get_db)):
-    try:
-        content = generate_pdf(db, month)
-        return Response(
-            content=content,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=shift_{month}.pdf"},
-        )
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+    return _spooled_response(
+        lambda out: generate_pdf(db, month, out),
+        media_type="application/pdf",
+        filename=f"shift_{month}.pdf",
+    )
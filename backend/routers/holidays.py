@@ -1,6 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 from models import HolidayOut
 from datetime import date
+from functools import lru_cache
+import calendar
+import json
 
 router = APIRouter(prefix="/api/holidays", tags=["holidays"])
 
@@ -69,13 +72,19 @@ JAPANESE_HOLIDAYS: dict[int, list[tuple[date, str]]] = {
 }
 
 
+# Holiday dates per year for O(1) membership checks
+_HOLIDAY_DATES: dict[int, frozenset[date]] = {
+    y: frozenset(d for d, _ in lst) for y, lst in JAPANESE_HOLIDAYS.items()
+}
+_NO_HOLIDAYS: frozenset[date] = frozenset()
+
+
 def get_holidays_for_year(year: int) -> list[tuple[date, str]]:
     return JAPANESE_HOLIDAYS.get(year, [])
 
 
 def is_holiday(d: date) -> bool:
-    holidays = get_holidays_for_year(d.year)
-    return any(h[0] == d for h in holidays)
+    return d in _HOLIDAY_DATES.get(d.year, _NO_HOLIDAYS)
 
 
 def is_non_working_day(d: date) -> bool:
@@ -83,7 +92,36 @@ def is_non_working_day(d: date) -> bool:
     return d.weekday() >= 5 or is_holiday(d)
 
 
+@lru_cache(maxsize=64)
+def working_days_in_month(year: int, month: int) -> tuple[date, ...]:
+    """Weekdays of the month that are not Japanese holidays, in date order."""
+    days_in_month = calendar.monthrange(year, month)[1]
+    return tuple(
+        d for d in (date(year, month, day) for day in range(1, days_in_month + 1))
+        if not is_non_working_day(d)
+    )
+
+
+# Response bodies per year, serialized once at import time
+_HOLIDAY_JSON: dict[int, bytes] = {
+    y: json.dumps(
+        [{"date": d.isoformat(), "name": n} for d, n in lst],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    for y, lst in JAPANESE_HOLIDAYS.items()
+}
+# The list only changes with a deploy, so let browsers/CDNs cache it
+_HOLIDAY_CACHE_HEADERS = {"Cache-Control": "public, max-age=86400, immutable"}
+
+
 @router.get("", response_model=list[HolidayOut])
-def list_holidays(year: int = 2026):
-    holidays = get_holidays_for_year(year)
-    return [HolidayOut(date=h[0], name=h[1]) for h in holidays]
+async def list_holidays(year: int = 2026):
+    # No I/O: run on the event loop instead of taking a threadpool worker.
+    # Returning a Response skips response_model serialization; the model
+    # still documents the schema.
+    return Response(
+        content=_HOLIDAY_JSON.get(year, b"[]"),
+        media_type="application/json",
+        headers=_HOLIDAY_CACHE_HEADERS,
+    )
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from database import get_db, JobType
 from models import JobTypeOut
@@ -8,7 +9,6 @@ router = APIRouter(prefix="/api/job-types", tags=["job_types"])
 
 @router.get("", response_model=list[JobTypeOut])
 def list_job_types(db: Session = Depends(get_db)):
-    return [
-        JobTypeOut(id=jt.id, name=jt.name, color=jt.color)
-        for jt in db.query(JobType).order_by(JobType.id).all()
-    ]
+    # 列だけを取得して ORM オブジェクトを作らずに返す
+    rows = db.execute(select(JobType.id, JobType.name, JobType.color).order_by(JobType.id))
+    return [JobTypeOut.model_construct(id=jt_id, name=name, color=color) for jt_id, name, color in rows]
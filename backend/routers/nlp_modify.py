@@ -1,60 +1,77 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, insert, literal, select, update
+from sqlalchemy.orm import Session, joinedload
 from database import (
     get_db, Schedule, ShiftAssignment, NlpModificationLog, Employee, JobType,
 )
 from models import NlpModifyRequest, NlpModifyResponse, ShiftAssignmentOut, NlpLogOut
 from services.nlp_service import parse_modification
 from services.optimizer import generate_schedule
+from collections import Counter, defaultdict
 from datetime import datetime
+from operator import attrgetter
 import json
 
 router = APIRouter(tags=["nlp_modify"])
 
 
-@router.post("/api/schedules/{schedule_id}/nlp-modify")
+@router.post("/api/schedules/{schedule_id}/nlp-modify", response_model=NlpModifyResponse)
 def nlp_modify(schedule_id: int, body: NlpModifyRequest, db: Session = Depends(get_db)):
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
 
-    # Build current summary and per-day detail for Claude
-    assignments = (
-        db.query(ShiftAssignment)
-        .filter(ShiftAssignment.schedule_id == schedule_id)
-        .all()
-    )
+    # Build current summary and per-day detail for Claude.
+    # Plain rows, not ORM entities: they are read-only here and stay valid after
+    # the log commit below, whereas expired entities would each be re-SELECTed
+    assignments = db.execute(
+        select(
+            ShiftAssignment.employee_id,
+            ShiftAssignment.date,
+            ShiftAssignment.job_type_id,
+            ShiftAssignment.work_type,
+        ).where(ShiftAssignment.schedule_id == schedule_id)
+    ).all()
     employees = db.query(Employee).all()
     job_types = db.query(JobType).all()
     jt_map = {jt.id: jt.name for jt in job_types}
+    # Lookup maps shared by the pin helpers below (built once per request)
+    jt_name_to_id = {name: id_ for id_, name in jt_map.items()}
+    emp_name_to_id = {emp.name: emp.id for emp in employees}
+    emp_names = {emp.id: emp.name for emp in employees}
 
-    # Summary (aggregate counts per employee)
-    summary_lines = []
-    for emp in employees:
-        emp_assignments = [a for a in assignments if a.employee_id == emp.id and a.work_type != "off"]
-        jt_counts: dict[str, int] = {}
-        for a in emp_assignments:
-            jt_name = jt_map.get(a.job_type_id, "不明")
-            jt_counts[jt_name] = jt_counts.get(jt_name, 0) + 1
-        counts_str = ", ".join(f"{k}: {v}日" for k, v in jt_counts.items())
-        summary_lines.append(f"- {emp.name}: 出勤{len(emp_assignments)}日 ({counts_str})")
-    current_summary = "\n".join(summary_lines)
+    # Dense id -> name table for the per-assignment lookups below. Job type ids
+    # are small autoincrement keys and assignments reference them by FK, so a
+    # list index replaces the dict hash; gaps read as "不明".
+    jt_names = ["不明"] * (max(jt_map, default=0) + 1)
+    for id_, name in jt_map.items():
+        jt_names[id_] = name
+
+    # Group assignments per employee in one pass
+    by_emp: dict[int, list] = defaultdict(list)
+    for a in assignments:
+        by_emp[a.employee_id].append(a)
 
-    # Per-day detail (e.g. "若生亜紀子: 3/1=休み, 3/2=データ, 3/3=職人, ...")
+    # Summary (aggregate counts per employee) and per-day detail
+    # (e.g. "若生亜紀子: 3/1=休み, 3/2=データ, 3/3=職人, ...") in one pass per employee
+    summary_lines = []
     detail_lines = []
     for emp in employees:
-        emp_assignments = sorted(
-            [a for a in assignments if a.employee_id == emp.id],
-            key=lambda a: a.date,
+        emp_assignments = by_emp[emp.id]
+        emp_assignments.sort(key=attrgetter("date"))
+        jt_counts = Counter(
+            jt_names[a.job_type_id] if a.job_type_id is not None else "不明"
+            for a in emp_assignments if a.work_type != "off"
         )
-        day_parts = []
-        for a in emp_assignments:
-            if a.work_type == "off" or a.job_type_id is None:
-                day_parts.append(f"{a.date.month}/{a.date.day}=休み")
-            else:
-                jt_name = jt_map.get(a.job_type_id, "不明")
-                day_parts.append(f"{a.date.month}/{a.date.day}={jt_name}")
+        counts_str = ", ".join(f"{k}: {v}日" for k, v in jt_counts.items())
+        summary_lines.append(f"- {emp.name}: 出勤{jt_counts.total()}日 ({counts_str})")
+        day_parts = [
+            f"{a.date.month}/{a.date.day}="
+            + ("休み" if a.work_type == "off" or a.job_type_id is None else jt_names[a.job_type_id])
+            for a in emp_assignments
+        ]
         detail_lines.append(f"- {emp.name}: {', '.join(day_parts)}")
+    current_summary = "\n".join(summary_lines)
     schedule_detail = "\n".join(detail_lines)
 
     # Parse with Claude
@@ -79,11 +96,12 @@ def nlp_modify(schedule_id: int, body: NlpModifyRequest, db: Session = Depends(g
     # Split parsed instructions into pin vs adjust
     pin_changes = [p for p in parsed if p.get("type") == "pin"]
     adjust_changes = [p for p in parsed if p.get("type") == "adjust"]
+    pins = _resolve_pins(pin_changes, jt_name_to_id, emp_name_to_id)
 
     # If there are only pin changes, apply them directly without re-optimization
     if pin_changes and not adjust_changes:
         new_schedule_id, changes = _apply_pin_changes(
-            db, schedule, assignments, pin_changes, jt_map, employees,
+            db, schedule, assignments, pins, jt_map, emp_names,
         )
         violations = []
     else:
@@ -96,14 +114,18 @@ def nlp_modify(schedule_id: int, body: NlpModifyRequest, db: Session = Depends(g
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
+        # Load the new assignments once (with employees) and reuse them for
+        # both the pin pass and the diff below
+        new_assignments_db = (
+            db.query(ShiftAssignment)
+            .options(joinedload(ShiftAssignment.employee))
+            .filter(ShiftAssignment.schedule_id == new_schedule_id)
+            .all()
+        )
+
         # If mixed, apply pin changes on top of the re-optimized schedule
         if pin_changes:
-            new_assignments_db = (
-                db.query(ShiftAssignment)
-                .filter(ShiftAssignment.schedule_id == new_schedule_id)
-                .all()
-            )
-            _apply_pins_to_assignments(db, new_assignments_db, pin_changes, jt_map, employees)
+            _apply_pins_to_assignments(db, new_assignments_db, pins)
 
         # Compute diff
         old_map = {}
@@ -111,11 +133,6 @@ def nlp_modify(schedule_id: int, body: NlpModifyRequest, db: Session = Depends(g
             old_map[(a.employee_id, a.date.isoformat())] = a.job_type_id
 
         changes = []
-        new_assignments_db = (
-            db.query(ShiftAssignment)
-            .filter(ShiftAssignment.schedule_id == new_schedule_id)
-            .all()
-        )
         for a in new_assignments_db:
             old_jt = old_map.get((a.employee_id, a.date.isoformat()))
             if old_jt != a.job_type_id:
@@ -149,19 +166,15 @@ def nlp_modify(schedule_id: int, body: NlpModifyRequest, db: Session = Depends(g
 def _apply_pin_changes(
     db: Session,
     old_schedule: Schedule,
-    old_assignments: list[ShiftAssignment],
-    pin_changes: list[dict],
+    old_assignments: list,
+    pins: dict[tuple[int, str], tuple[int | None, str, float]],
     jt_map: dict[int, str],
-    employees: list[Employee],
+    emp_names: dict[int, str],
 ) -> tuple[int, list[dict]]:
     """
     Apply pin (date-specific) changes by copying the old schedule and modifying
     only the pinned cells. Returns (new_schedule_id, changes_list).
     """
-    # Build reverse maps
-    jt_name_to_id = {name: id_ for id_, name in jt_map.items()}
-    emp_name_to_id = {emp.name: emp.id for emp in employees}
-
     # Create new schedule
     new_schedule = Schedule(
         target_month=old_schedule.target_month,
@@ -171,70 +184,77 @@ def _apply_pin_changes(
     db.add(new_schedule)
     db.flush()  # get new_schedule.id
 
-    # Copy all assignments from old schedule to new schedule
-    old_map: dict[tuple[int, str], ShiftAssignment] = {}
-    for a in old_assignments:
-        old_map[(a.employee_id, a.date.isoformat())] = a
-        new_a = ShiftAssignment(
-            schedule_id=new_schedule.id,
-            employee_id=a.employee_id,
-            date=a.date,
-            job_type_id=a.job_type_id,
-            work_type=a.work_type,
-            headcount_value=a.headcount_value,
+    # Copy all assignments from old schedule to new schedule server-side
+    # (one INSERT ... SELECT instead of one INSERT per row)
+    db.execute(
+        insert(ShiftAssignment).from_select(
+            ["schedule_id", "employee_id", "date", "job_type_id", "work_type", "headcount_value"],
+            select(
+                literal(new_schedule.id),
+                ShiftAssignment.employee_id,
+                ShiftAssignment.date,
+                ShiftAssignment.job_type_id,
+                ShiftAssignment.work_type,
+                ShiftAssignment.headcount_value,
+            ).where(ShiftAssignment.schedule_id == old_schedule.id),
         )
-        db.add(new_a)
-    db.flush()
-
-    # Load new assignments for modification
-    new_assignments = (
-        db.query(ShiftAssignment)
-        .filter(ShiftAssignment.schedule_id == new_schedule.id)
-        .all()
     )
-    _apply_pins_to_assignments(db, new_assignments, pin_changes, jt_map, employees)
 
-    # Compute diff
+    # Update only the pinned cells, computing the diff against the old schedule
+    old_map = {(a.employee_id, a.date.isoformat()): a for a in old_assignments}
+    updates = []
     changes = []
-    new_assignments = (
-        db.query(ShiftAssignment)
-        .filter(ShiftAssignment.schedule_id == new_schedule.id)
-        .all()
-    )
-    for a in new_assignments:
-        old_a = old_map.get((a.employee_id, a.date.isoformat()))
-        old_jt = old_a.job_type_id if old_a else None
-        if old_jt != a.job_type_id:
-            old_name = jt_map.get(old_jt, "休み") if old_jt else "休み"
-            new_name = jt_map.get(a.job_type_id, "休み") if a.job_type_id else "休み"
+    for key, (jt_id, work_type, headcount) in pins.items():
+        old_a = old_map.get(key)
+        if old_a is None:
+            continue
+        updates.append({
+            "emp_id": old_a.employee_id,
+            "day": old_a.date,
+            "new_job_type_id": jt_id,
+            "new_work_type": work_type,
+            "new_headcount_value": headcount,
+        })
+        if old_a.job_type_id != jt_id:
             changes.append({
-                "employee_id": a.employee_id,
-                "employee_name": a.employee.name if a.employee else "",
-                "date": a.date.isoformat(),
-                "old_job_type": old_name,
-                "new_job_type": new_name,
+                "employee_id": old_a.employee_id,
+                "employee_name": emp_names.get(old_a.employee_id, ""),
+                "date": key[1],
+                "old_job_type": jt_map.get(old_a.job_type_id, "休み") if old_a.job_type_id else "休み",
+                "new_job_type": jt_map.get(jt_id, "休み") if jt_id else "休み",
             })
 
+    if updates:
+        sa = ShiftAssignment.__table__
+        db.execute(
+            update(sa)
+            .where(
+                sa.c.schedule_id == new_schedule.id,
+                sa.c.employee_id == bindparam("emp_id"),
+                sa.c.date == bindparam("day"),
+            )
+            .values(
+                job_type_id=bindparam("new_job_type_id"),
+                work_type=bindparam("new_work_type"),
+                headcount_value=bindparam("new_headcount_value"),
+            ),
+            updates,
+        )
+
     db.commit()
     return new_schedule.id, changes
 
 
-def _apply_pins_to_assignments(
-    db: Session,
-    assignments: list[ShiftAssignment],
+def _resolve_pins(
     pin_changes: list[dict],
-    jt_map: dict[int, str],
-    employees: list[Employee],
-) -> None:
-    """Mutate assignment records in-place based on pin changes."""
-    jt_name_to_id = {name: id_ for id_, name in jt_map.items()}
-    emp_name_to_id = {emp.name: emp.id for emp in employees}
-
-    # Index assignments by (employee_id, date_iso)
-    assign_map: dict[tuple[int, str], ShiftAssignment] = {}
-    for a in assignments:
-        assign_map[(a.employee_id, a.date.isoformat())] = a
-
+    jt_name_to_id: dict[str, int],
+    emp_name_to_id: dict[str, int],
+) -> dict[tuple[int, str], tuple[int | None, str, float]]:
+    """
+    Resolve pin changes to {(employee_id, date_iso): (job_type_id, work_type, headcount_value)}.
+    Pins with an unknown employee or job type are dropped; later pins win.
+    """
+    resolved: dict[tuple[int, str], tuple[int | None, str, float]] = {}
     for pin in pin_changes:
         emp_id = emp_name_to_id.get(pin.get("employee_name", ""))
         date_str = pin.get("date", "")
@@ -243,27 +263,40 @@ def _apply_pins_to_assignments(
         if not emp_id or not date_str:
             continue
 
-        target = assign_map.get((emp_id, date_str))
-        if not target:
-            continue
-
         if new_jt_name == "休み":
-            target.job_type_id = None
-            target.work_type = "off"
-            target.headcount_value = 0
+            resolved[(emp_id, date_str)] = (None, "off", 0)
         else:
             jt_id = jt_name_to_id.get(new_jt_name)
             if jt_id is not None:
-                target.job_type_id = jt_id
-                target.work_type = "full"
-                target.headcount_value = 1.0
+                resolved[(emp_id, date_str)] = (jt_id, "full", 1.0)
+    return resolved
+
+
+def _apply_pins_to_assignments(
+    db: Session,
+    assignments: list[ShiftAssignment],
+    pins: dict[tuple[int, str], tuple[int | None, str, float]],
+) -> None:
+    """Mutate assignment records in-place based on resolved pins."""
+    # Index assignments by (employee_id, date_iso)
+    assign_map: dict[tuple[int, str], ShiftAssignment] = {}
+    for a in assignments:
+        assign_map[(a.employee_id, a.date.isoformat())] = a
+
+    for key, (jt_id, work_type, headcount) in pins.items():
+        target = assign_map.get(key)
+        if not target:
+            continue
+        target.job_type_id = jt_id
+        target.work_type = work_type
+        target.headcount_value = headcount
 
     db.flush()
 
 
 @router.put("/api/nlp-logs/{log_id}/approve")
 def approve_log(log_id: int, db: Session = Depends(get_db)):
-    log = db.query(NlpModificationLog).filter(NlpModificationLog.id == log_id).first()
+    log = db.get(NlpModificationLog, log_id)
     if not log:
         raise HTTPException(status_code=404, detail="Log not found")
     log.status = "approved"
@@ -273,7 +306,7 @@ def approve_log(log_id: int, db: Session = Depends(get_db)):
 
 @router.put("/api/nlp-logs/{log_id}/reject")
 def reject_log(log_id: int, db: Session = Depends(get_db)):
-    log = db.query(NlpModificationLog).filter(NlpModificationLog.id == log_id).first()
+    log = db.get(NlpModificationLog, log_id)
     if not log:
         raise HTTPException(status_code=404, detail="Log not found")
 
@@ -281,7 +314,7 @@ def reject_log(log_id: int, db: Session = Depends(get_db)):
     parsed = json.loads(log.parsed_instruction) if log.parsed_instruction else {}
     new_schedule_id = parsed.get("new_schedule_id")
     if new_schedule_id:
-        new_schedule = db.query(Schedule).filter(Schedule.id == new_schedule_id).first()
+        new_schedule = db.get(Schedule, new_schedule_id)
         if new_schedule:
             db.delete(new_schedule)
 
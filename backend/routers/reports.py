@@ -1,7 +1,11 @@
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from database import get_db, Schedule, ShiftAssignment, Employee, ShiftRequest, JobType
-from models import ReportOut, EmployeeReportOut
+from models import ReportOut
 from routers.holidays import is_non_working_day
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
@@ -10,65 +14,83 @@ router = APIRouter(prefix="/api/reports", tags=["reports"])
 @router.get("", response_model=ReportOut)
 def get_report(month: str, db: Session = Depends(get_db)):
     # Find latest schedule for the month
-    schedule = (
-        db.query(Schedule)
-        .filter(Schedule.target_month == month)
+    schedule_id = db.scalar(
+        select(Schedule.id)
+        .where(Schedule.target_month == month)
         .order_by(Schedule.id.desc())
-        .first()
+        .limit(1)
     )
-    if not schedule:
+    if schedule_id is None:
         return ReportOut(month=month)
 
-    employees = db.query(Employee).order_by(Employee.sort_order).all()
-    job_types = db.query(JobType).all()
-    jt_map = {jt.id: jt.name for jt in job_types}
+    # Non-working days (weekends + holidays) of the month, computed once
+    year, mo = map(int, month.split("-"))
+    month_days = (date(year, mo, day) for day in range(1, monthrange(year, mo)[1] + 1))
+    non_working = {d for d in month_days if is_non_working_day(d)}
 
-    assignments = (
-        db.query(ShiftAssignment)
-        .filter(ShiftAssignment.schedule_id == schedule.id)
-        .all()
-    )
+    employees = db.execute(
+        select(Employee.id, Employee.name).order_by(Employee.sort_order)
+    ).all()
+    jt_map = dict(db.execute(select(JobType.id, JobType.name)).all())
+
+    # Aggregate in SQL: headcount per (employee, job type) for work days ...
+    work_rows = db.execute(
+        select(
+            ShiftAssignment.employee_id,
+            ShiftAssignment.job_type_id,
+            func.sum(ShiftAssignment.headcount_value),
+        )
+        .where(ShiftAssignment.schedule_id == schedule_id, ShiftAssignment.work_type != "off")
+        .group_by(ShiftAssignment.employee_id, ShiftAssignment.job_type_id)
+        .order_by(ShiftAssignment.employee_id, ShiftAssignment.job_type_id)
+    ).all()
+    # ... and days off that fall on working days (weekends/holidays don't count)
+    off_counts = dict(db.execute(
+        select(ShiftAssignment.employee_id, func.count())
+        .where(
+            ShiftAssignment.schedule_id == schedule_id,
+            ShiftAssignment.work_type == "off",
+            ShiftAssignment.date.not_in(non_working),
+        )
+        .group_by(ShiftAssignment.employee_id)
+    ).all())
+    requested = dict(db.execute(
+        select(ShiftRequest.employee_id, ShiftRequest.requested_work_days)
+        .where(ShiftRequest.target_month == month)
+    ).all())
+
+    jt_counts_by_emp: dict[int, dict[str, float]] = defaultdict(dict)
+    for emp_id, jt_id, headcount in work_rows:
+        jt_counts = jt_counts_by_emp[emp_id]
+        jt_name = jt_map.get(jt_id, "不明")
+        jt_counts[jt_name] = jt_counts.get(jt_name, 0) + headcount
 
     emp_reports = []
     work_days_list = []
 
     for emp in employees:
-        emp_assignments = [a for a in assignments if a.employee_id == emp.id]
-        work_assignments = [a for a in emp_assignments if a.work_type != "off"]
-        off_assignments = [a for a in emp_assignments if a.work_type == "off"]
+        jt_counts = jt_counts_by_emp.get(emp.id, {})
+        total_work = sum(jt_counts.values())
+        requested_work_days = requested.get(emp.id)
 
-        total_work = sum(a.headcount_value for a in work_assignments)
-        total_off = len([a for a in off_assignments if not is_non_working_day(a.date)])
-
-        jt_counts: dict[str, float] = {}
-        for a in work_assignments:
-            jt_name = jt_map.get(a.job_type_id, "不明")
-            jt_counts[jt_name] = jt_counts.get(jt_name, 0) + a.headcount_value
-
-        # Get request data
-        req = (
-            db.query(ShiftRequest)
-            .filter(ShiftRequest.employee_id == emp.id, ShiftRequest.target_month == month)
-            .first()
-        )
-
-        emp_reports.append(EmployeeReportOut(
-            employee_id=emp.id,
-            employee_name=emp.name,
-            total_work_days=total_work,
-            total_days_off=total_off,
-            requested_work_days=str(req.requested_work_days) if req and req.requested_work_days is not None else None,
-            job_type_counts=jt_counts,
-        ))
+        # Plain dicts: response_model validates/serializes the payload once
+        emp_reports.append({
+            "employee_id": emp.id,
+            "employee_name": emp.name,
+            "total_work_days": total_work,
+            "total_days_off": off_counts.get(emp.id, 0),
+            "requested_work_days": str(requested_work_days) if requested_work_days is not None else None,
+            "job_type_counts": jt_counts,
+        })
         work_days_list.append(total_work)
 
     fairness_max = max(work_days_list) if work_days_list else 0
     fairness_min = min(work_days_list) if work_days_list else 0
 
-    return ReportOut(
-        month=month,
-        employees=emp_reports,
-        fairness_max=fairness_max,
-        fairness_min=fairness_min,
-        fairness_diff=fairness_max - fairness_min,
-    )
+    return {
+        "month": month,
+        "employees": emp_reports,
+        "fairness_max": fairness_max,
+        "fairness_min": fairness_min,
+        "fairness_diff": fairness_max - fairness_min,
+    }
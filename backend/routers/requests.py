@@ -1,53 +1,68 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.orm import Session, joinedload, selectinload
 from database import get_db, Employee, ShiftRequest, RequestDetail
 from models import ShiftRequestCreate, ShiftRequestOut, RequestDetailOut, RequestStatusOut
 
 router = APIRouter(prefix="/api/requests", tags=["requests"])
 
+# _request_to_out が参照するリレーションを一括ロードする（N+1 回避）
+_REQUEST_LOAD_OPTIONS = (
+    joinedload(ShiftRequest.employee),
+    selectinload(ShiftRequest.details),
+)
+
 
 def _request_to_out(req: ShiftRequest) -> ShiftRequestOut:
-    return ShiftRequestOut(
+    # 希望休の明細まで含めて model_construct で組み立てる（明細1件ごとの検証を省く）。
+    # 旧データの差異（period 未設定、整数の requested_work_days）はここで補正しておく
+    return ShiftRequestOut.model_construct(
         id=req.id,
         employee_id=req.employee_id,
         employee_name=req.employee.name if req.employee else "",
         target_month=req.target_month,
         requested_work_days=str(req.requested_work_days) if req.requested_work_days is not None else None,
         note=req.note,
-        details=[RequestDetailOut(id=d.id, date=d.date, period=d.period or "all_day") for d in req.details],
+        details=[
+            RequestDetailOut.model_construct(id=d.id, date=d.date, period=d.period or "all_day")
+            for d in req.details
+        ],
     )
 
 
 @router.get("", response_model=list[ShiftRequestOut])
 def list_requests(month: str, db: Session = Depends(get_db)):
-    reqs = (
-        db.query(ShiftRequest)
-        .filter(ShiftRequest.target_month == month)
+    reqs = db.scalars(
+        select(ShiftRequest)
+        .options(*_REQUEST_LOAD_OPTIONS)
+        .where(ShiftRequest.target_month == month)
         .order_by(ShiftRequest.employee_id)
-        .all()
-    )
+    ).all()
     return [_request_to_out(r) for r in reqs]
 
 
 @router.get("/status", response_model=list[RequestStatusOut])
 def request_status(month: str, db: Session = Depends(get_db)):
-    employees = db.query(Employee).order_by(Employee.sort_order).all()
-    result = []
-    for emp in employees:
-        has = (
-            db.query(ShiftRequest)
-            .filter(ShiftRequest.employee_id == emp.id, ShiftRequest.target_month == month)
-            .first()
-            is not None
-        )
-        result.append(RequestStatusOut(employee_id=emp.id, employee_name=emp.name, has_request=has))
-    return result
+    # 提出有無は相関 EXISTS で判定し、スタッフ全員分を1クエリで取得する
+    has_request = (
+        exists()
+        .where(ShiftRequest.employee_id == Employee.id, ShiftRequest.target_month == month)
+        .label("has_request")
+    )
+    rows = db.execute(
+        select(Employee.id, Employee.name, has_request).order_by(Employee.sort_order)
+    )
+    return [
+        RequestStatusOut.model_construct(employee_id=emp_id, employee_name=name, has_request=bool(has))
+        for emp_id, name, has in rows
+    ]
 
 
 @router.get("/{employee_id}", response_model=ShiftRequestOut)
 def get_request(employee_id: int, month: str, db: Session = Depends(get_db)):
     req = (
         db.query(ShiftRequest)
+        .options(*_REQUEST_LOAD_OPTIONS)
         .filter(ShiftRequest.employee_id == employee_id, ShiftRequest.target_month == month)
         .first()
     )
@@ -58,22 +73,19 @@ def get_request(employee_id: int, month: str, db: Session = Depends(get_db)):
 
 @router.post("", response_model=ShiftRequestOut, status_code=201)
 def upsert_request(body: ShiftRequestCreate, db: Session = Depends(get_db)):
-    emp = db.query(Employee).filter(Employee.id == body.employee_id).first()
+    emp = db.get(Employee, body.employee_id)
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
 
-    # Upsert: delete existing for same employee+month
-    existing = (
-        db.query(ShiftRequest)
-        .filter(
+    # Upsert: delete existing for same employee+month in one statement;
+    # request_details rows go with it via ON DELETE CASCADE
+    db.execute(
+        delete(ShiftRequest).where(
             ShiftRequest.employee_id == body.employee_id,
             ShiftRequest.target_month == body.target_month,
-        )
-        .first()
+        ),
+        execution_options={"synchronize_session": False},
     )
-    if existing:
-        db.delete(existing)
-        db.flush()
 
     req = ShiftRequest(
         employee_id=body.employee_id,
@@ -84,9 +96,26 @@ def upsert_request(body: ShiftRequestCreate, db: Session = Depends(get_db)):
     db.add(req)
     db.flush()
 
-    for d in body.days_off:
-        db.add(RequestDetail(shift_request_id=req.id, date=d.date, period=d.period))
+    # 希望休は1回の executemany INSERT で登録し、採番された id を入力順で受け取る
+    detail_ids = []
+    if body.days_off:
+        detail_ids = db.scalars(
+            insert(RequestDetail).returning(RequestDetail.id, sort_by_parameter_order=True),
+            [{"shift_request_id": req.id, "date": d.date, "period": d.period} for d in body.days_off],
+        ).all()
 
+    # コミット後の再読み込みを避けるため、レスポンスは手元の値から組み立てる
+    out = ShiftRequestOut.model_construct(
+        id=req.id,
+        employee_id=body.employee_id,
+        employee_name=emp.name,
+        target_month=body.target_month,
+        requested_work_days=body.requested_work_days,
+        note=body.note,
+        details=[
+            RequestDetailOut.model_construct(id=detail_id, date=d.date, period=d.period)
+            for detail_id, d in zip(detail_ids, body.days_off)
+        ],
+    )
     db.commit()
-    db.refresh(req)
-    return _request_to_out(req)
+    return out
@@ -1,60 +1,61 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from database import get_db, DailyRequirement, JobType
 from models import DailyRequirementsCreate, DailyRequirementOut, RequirementsTemplate
-from routers.holidays import is_non_working_day
+from routers.holidays import working_days_in_month
 from datetime import date, timedelta
 import calendar
 
 router = APIRouter(prefix="/api/requirements", tags=["requirements"])
 
 
-def _req_to_out(r: DailyRequirement) -> DailyRequirementOut:
-    return DailyRequirementOut(
-        id=r.id,
-        date=r.date,
-        job_type_id=r.job_type_id,
-        job_type_name=r.job_type.name if r.job_type else "",
-        required_count=r.required_count,
-    )
-
-
 @router.get("", response_model=list[DailyRequirementOut])
 def list_requirements(month: str, db: Session = Depends(get_db)):
     year, mon = map(int, month.split("-"))
     days_in_month = calendar.monthrange(year, mon)[1]
     start = date(year, mon, 1)
     end = date(year, mon, days_in_month)
-    reqs = (
-        db.query(DailyRequirement)
-        .filter(DailyRequirement.date >= start, DailyRequirement.date <= end)
+    # 仕事種類名は JOIN で取得し、ORM オブジェクトを作らずに dict で返す
+    rows = db.execute(
+        select(
+            DailyRequirement.id,
+            DailyRequirement.date,
+            DailyRequirement.job_type_id,
+            func.coalesce(JobType.name, "").label("job_type_name"),
+            DailyRequirement.required_count,
+        )
+        .select_from(DailyRequirement)
+        .outerjoin(JobType, JobType.id == DailyRequirement.job_type_id)
+        .where(DailyRequirement.date >= start, DailyRequirement.date <= end)
         .order_by(DailyRequirement.date, DailyRequirement.job_type_id)
-        .all()
     )
-    return [_req_to_out(r) for r in reqs]
+    return [row._asdict() for row in rows]
+
+
+def _upsert_requirements(db: Session, rows: dict[tuple[date, int], float]) -> None:
+    """(date, job_type_id) -> required_count をまとめて1文で UPSERT する。"""
+    if not rows:
+        return
+    dialect_insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    stmt = dialect_insert(DailyRequirement).values([
+        {"date": d, "job_type_id": jt_id, "required_count": count}
+        for (d, jt_id), count in rows.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["date", "job_type_id"],
+        set_={"required_count": stmt.excluded.required_count},
+    )
+    db.execute(stmt)
 
 
 @router.post("", status_code=201)
 def upsert_requirements(body: DailyRequirementsCreate, db: Session = Depends(get_db)):
-    for item in body.items:
-        existing = (
-            db.query(DailyRequirement)
-            .filter(
-                DailyRequirement.date == item.date,
-                DailyRequirement.job_type_id == item.job_type_id,
-            )
-            .first()
-        )
-        if existing:
-            existing.required_count = item.required_count
-        else:
-            db.add(
-                DailyRequirement(
-                    date=item.date,
-                    job_type_id=item.job_type_id,
-                    required_count=item.required_count,
-                )
-            )
+    # 同じ (日付, 仕事種類) が複数あれば後勝ち（1文の UPSERT で同じ行を2回更新できないため）
+    rows = {(item.date, item.job_type_id): item.required_count for item in body.items}
+    _upsert_requirements(db, rows)
     db.commit()
     return {"status": "ok"}
 
@@ -62,33 +63,12 @@ def upsert_requirements(body: DailyRequirementsCreate, db: Session = Depends(get
 @router.post("/template", status_code=201)
 def apply_template(body: RequirementsTemplate, db: Session = Depends(get_db)):
     year, mon = map(int, body.month.split("-"))
-    days_in_month = calendar.monthrange(year, mon)[1]
-
-    for day_num in range(1, days_in_month + 1):
-        d = date(year, mon, day_num)
-        if is_non_working_day(d):
-            continue
-        weekday = d.weekday()  # 0=Mon
-        if weekday not in body.weekday_requirements:
-            continue
-        for tmpl in body.weekday_requirements[weekday]:
-            existing = (
-                db.query(DailyRequirement)
-                .filter(
-                    DailyRequirement.date == d,
-                    DailyRequirement.job_type_id == tmpl.job_type_id,
-                )
-                .first()
-            )
-            if existing:
-                existing.required_count = tmpl.required_count
-            else:
-                db.add(
-                    DailyRequirement(
-                        date=d,
-                        job_type_id=tmpl.job_type_id,
-                        required_count=tmpl.required_count,
-                    )
-                )
+    # 営業日（土日祝を除く）の一覧は月ごとにキャッシュ済み。曜日テンプレートを当てはめて一括 UPSERT する
+    rows = {
+        (d, tmpl.job_type_id): tmpl.required_count
+        for d in working_days_in_month(year, mon)
+        for tmpl in body.weekday_requirements.get(d.weekday(), ())
+    }
+    _upsert_requirements(db, rows)
     db.commit()
     return {"status": "ok"}
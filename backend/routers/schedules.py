@@ -1,29 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
 from database import get_db, Schedule, ShiftAssignment, Employee, JobType, cleanup_old_schedules
 from models import (
     ScheduleOut, ShiftAssignmentOut, ShiftAssignmentUpdate,
-    ScheduleGenerate, StatusUpdate,
+    ScheduleGenerate, ScheduleGenerateOut, StatusUpdate,
 )
 from services.optimizer import generate_schedule
 from datetime import datetime
 
 router = APIRouter(prefix="/api/schedules", tags=["schedules"])
 
-
-def _assignment_to_out(a: ShiftAssignment) -> ShiftAssignmentOut:
-    return ShiftAssignmentOut(
-        id=a.id,
-        schedule_id=a.schedule_id,
-        employee_id=a.employee_id,
-        employee_name=a.employee.name if a.employee else "",
-        date=a.date,
-        job_type_id=a.job_type_id,
-        job_type_name=a.job_type.name if a.job_type else None,
-        job_type_color=a.job_type.color if a.job_type else None,
-        work_type=a.work_type,
-        headcount_value=a.headcount_value,
-    )
+# headcount_value per work_type; anything else ("full") counts as 1.0
+_HEADCOUNT = {"off": 0.0, "morning_half": 0.5, "afternoon_half": 0.5}
 
 
 @router.get("", response_model=list[ScheduleOut])
@@ -33,18 +22,18 @@ def list_schedules(month: str | None = None, db: Session = Depends(get_db)):
         q = q.filter(Schedule.target_month == month)
     schedules = q.order_by(Schedule.id.desc()).all()
     return [
-        ScheduleOut(
-            id=s.id,
-            target_month=s.target_month,
-            status=s.status,
-            generated_at=s.generated_at.isoformat() if s.generated_at else None,
-            confirmed_at=s.confirmed_at.isoformat() if s.confirmed_at else None,
-        )
+        {
+            "id": s.id,
+            "target_month": s.target_month,
+            "status": s.status,
+            "generated_at": s.generated_at.isoformat() if s.generated_at else None,
+            "confirmed_at": s.confirmed_at.isoformat() if s.confirmed_at else None,
+        }
         for s in schedules
     ]
 
 
-@router.post("/generate")
+@router.post("/generate", response_model=ScheduleGenerateOut)
 def generate(body: ScheduleGenerate, db: Session = Depends(get_db)):
     try:
         schedule_id, assignments, violations = generate_schedule(db, body.month)
@@ -66,45 +55,63 @@ def generate(body: ScheduleGenerate, db: Session = Depends(get_db)):
 
 @router.get("/{schedule_id}/assignments", response_model=list[ShiftAssignmentOut])
 def get_assignments(schedule_id: int, db: Session = Depends(get_db)):
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
-    assignments = (
-        db.query(ShiftAssignment)
-        .filter(ShiftAssignment.schedule_id == schedule_id)
+    # Flat JOIN straight into dicts: no ORM objects are built for the ~400
+    # rows of a month; response_model validates/serializes them once
+    rows = db.execute(
+        select(
+            ShiftAssignment.id,
+            ShiftAssignment.schedule_id,
+            ShiftAssignment.employee_id,
+            func.coalesce(Employee.name, "").label("employee_name"),
+            ShiftAssignment.date,
+            ShiftAssignment.job_type_id,
+            JobType.name.label("job_type_name"),
+            JobType.color.label("job_type_color"),
+            ShiftAssignment.work_type,
+            ShiftAssignment.headcount_value,
+        )
+        .select_from(ShiftAssignment)
+        .outerjoin(Employee, Employee.id == ShiftAssignment.employee_id)
+        .outerjoin(JobType, JobType.id == ShiftAssignment.job_type_id)
+        .where(ShiftAssignment.schedule_id == schedule_id)
         .order_by(ShiftAssignment.employee_id, ShiftAssignment.date)
-        .all()
     )
-    return [_assignment_to_out(a) for a in assignments]
+    return [row._asdict() for row in rows]
 
 
 @router.put("/{schedule_id}/assignments")
 def update_assignments(
     schedule_id: int, body: list[ShiftAssignmentUpdate], db: Session = Depends(get_db)
 ):
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
 
-    for item in body:
-        existing = (
-            db.query(ShiftAssignment)
-            .filter(
-                ShiftAssignment.schedule_id == schedule_id,
-                ShiftAssignment.employee_id == item.employee_id,
-                ShiftAssignment.date == item.date,
-            )
-            .first()
+    # Resolve (employee_id, date) -> id for the whole schedule in one query,
+    # then apply every change with a single executemany UPDATE by primary key
+    ids = {
+        (emp_id, d): a_id
+        for a_id, emp_id, d in db.execute(
+            select(ShiftAssignment.id, ShiftAssignment.employee_id, ShiftAssignment.date)
+            .where(ShiftAssignment.schedule_id == schedule_id)
         )
-        if existing:
-            existing.job_type_id = item.job_type_id
-            existing.work_type = item.work_type
-            if item.work_type == "off":
-                existing.headcount_value = 0
-            elif item.work_type in ("morning_half", "afternoon_half"):
-                existing.headcount_value = 0.5
-            else:
-                existing.headcount_value = 1.0
+    }
+    mappings = []
+    for item in body:
+        a_id = ids.get((item.employee_id, item.date))
+        if a_id is None:
+            continue
+        mappings.append({
+            "id": a_id,
+            "job_type_id": item.job_type_id,
+            "work_type": item.work_type,
+            "headcount_value": _HEADCOUNT.get(item.work_type, 1.0),
+        })
+    if mappings:
+        db.execute(update(ShiftAssignment), mappings)
 
     db.commit()
     return {"status": "ok"}
@@ -112,7 +119,7 @@ def update_assignments(
 
 @router.put("/{schedule_id}/status")
 def update_status(schedule_id: int, body: StatusUpdate, db: Session = Depends(get_db)):
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
 
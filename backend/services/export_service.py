@@ -1,18 +1,25 @@
 import csv
-import io
+from collections import OrderedDict
+from collections.abc import Iterator
+from typing import BinaryIO
 from datetime import date
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from functools import lru_cache
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A3, landscape
 from reportlab.lib.units import mm
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Spacer
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from sqlalchemy import exists, select
 from sqlalchemy.orm import Session
-from database import Schedule, ShiftAssignment, Employee, JobType, ShiftRequest
+from database import (
+    Schedule, ShiftAssignment, Employee, JobType, ShiftRequest, RequestDetail, get_data_version,
+)
 import calendar
 import os
+import threading
+import time
+import xlsxwriter
 
 
 JOB_TYPE_COLORS = {
@@ -23,73 +30,162 @@ JOB_TYPE_COLORS = {
 }
 
 
+# Export data per (schedule_id, data version). Downloading CSV/Excel/PDF in a row
+# builds the grid once; any committed write bumps the version, so edits are
+# never served stale. Holds plain rows/dicts only, never ORM objects.
+_SCHEDULE_DATA_CACHE: OrderedDict[tuple[int, int], tuple] = OrderedDict()
+_SCHEDULE_DATA_CACHE_SIZE = 8
+_schedule_data_lock = threading.Lock()
+
+
 def _get_schedule_data(db: Session, month: str):
-    schedule = (
-        db.query(Schedule)
-        .filter(Schedule.target_month == month)
+    schedule_id = db.scalar(
+        select(Schedule.id)
+        .where(Schedule.target_month == month)
         .order_by(Schedule.id.desc())
-        .first()
+        .limit(1)
     )
-    if not schedule:
+    if schedule_id is None:
         raise ValueError("No schedule found for the specified month")
 
-    employees = db.query(Employee).order_by(Employee.sort_order).all()
-    job_types = db.query(JobType).order_by(JobType.id).all()
+    key = (schedule_id, get_data_version())
+    with _schedule_data_lock:
+        data = _SCHEDULE_DATA_CACHE.get(key)
+        if data is not None:
+            _SCHEDULE_DATA_CACHE.move_to_end(key)
+            return data
+
+    data = _build_schedule_data(db, month, schedule_id)
+    with _schedule_data_lock:
+        # Entries from older data versions can never be hit again; drop them
+        # now instead of letting them sit in the LRU until evicted. A build
+        # that raced with a write is returned but not cached
+        version = get_data_version()
+        for stale in [k for k in _SCHEDULE_DATA_CACHE if k[1] < version]:
+            del _SCHEDULE_DATA_CACHE[stale]
+        if key[1] == version:
+            _SCHEDULE_DATA_CACHE[key] = data
+        while len(_SCHEDULE_DATA_CACHE) > _SCHEDULE_DATA_CACHE_SIZE:
+            _SCHEDULE_DATA_CACHE.popitem(last=False)
+    return data
+
+
+@lru_cache(maxsize=64)
+def _month_dates(month: str) -> tuple[date, ...]:
+    year, mon = map(int, month.split("-"))
+    days_in_month = calendar.monthrange(year, mon)[1]
+    return tuple(date(year, mon, d) for d in range(1, days_in_month + 1))
+
+
+# Job types are seeded at startup and have no write endpoint, so they are
+# re-read at most every _JOB_TYPES_TTL seconds instead of on every export
+_JOB_TYPES_TTL = 300.0
+_job_types_cache: tuple[float, list] | None = None
+
+
+def _load_job_types(db: Session) -> list:
+    global _job_types_cache
+    cached = _job_types_cache
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < _JOB_TYPES_TTL:
+        return cached[1]
+    job_types = db.execute(select(JobType.id, JobType.name).order_by(JobType.id)).all()
+    _job_types_cache = (now, job_types)
+    return job_types
+
+
+def _build_schedule_data(db: Session, month: str, schedule_id: int):
+    employees = db.execute(
+        select(Employee.id, Employee.name).order_by(Employee.sort_order)
+    ).all()
+    job_types = _load_job_types(db)
     jt_map = {jt.id: jt.name for jt in job_types}
 
-    assignments = (
-        db.query(ShiftAssignment)
-        .filter(ShiftAssignment.schedule_id == schedule.id)
-        .order_by(ShiftAssignment.employee_id, ShiftAssignment.date)
-        .all()
+    # 希望休かどうかは相関 EXISTS で割り当てと同じクエリで判定する
+    requested = (
+        exists()
+        .where(
+            ShiftRequest.employee_id == ShiftAssignment.employee_id,
+            ShiftRequest.target_month == month,
+            RequestDetail.shift_request_id == ShiftRequest.id,
+            RequestDetail.date == ShiftAssignment.date,
+        )
+        .label("requested")
     )
-
-    year, mon = map(int, month.split("-"))
-    days_in_month = calendar.monthrange(year, mon)[1]
-    dates = [date(year, mon, d) for d in range(1, days_in_month + 1)]
-
-    # 希望休の日付セットを構築
-    requests = db.query(ShiftRequest).filter(ShiftRequest.target_month == month).all()
-    requested_off: set[tuple[int, date]] = set()
-    for req in requests:
-        for detail in req.details:
-            requested_off.add((req.employee_id, detail.date))
-
-    # Build matrix: emp_id -> date -> job_type_name
-    matrix: dict[int, dict[date, str]] = {}
-    # Build summary: job_type_id -> date -> headcount
-    summary: dict[int, dict[date, float]] = {jt.id: {d: 0.0 for d in dates} for jt in job_types}
-    daily_totals: dict[date, float] = {d: 0.0 for d in dates}
-
-    for a in assignments:
-        if a.employee_id not in matrix:
-            matrix[a.employee_id] = {}
-        if a.job_type_id and a.work_type != "off":
-            name = jt_map.get(a.job_type_id, "")
-            if a.work_type == "morning_half":
+    # Plain tuples; the grid is indexed by employee/day so no ORDER BY is needed
+    assignments = db.execute(
+        select(
+            ShiftAssignment.employee_id,
+            ShiftAssignment.date,
+            ShiftAssignment.job_type_id,
+            ShiftAssignment.work_type,
+            ShiftAssignment.headcount_value,
+            requested,
+        ).where(ShiftAssignment.schedule_id == schedule_id)
+    ).all()
+
+    dates = _month_dates(month)
+
+    # Build grid: one row per employee (in `employees` order), one column per
+    # date; cells are (label, job_type_id or None for days off). Built once per
+    # cache entry so the renderers never look cells up by key
+    emp_row_idx = {emp.id: i for i, emp in enumerate(employees)}
+    grid: list[list[tuple[str, int | None]]] = [[_EMPTY_CELL] * len(dates) for _ in employees]
+    # Build summary: job_type_id -> headcount per day, indexed like the grid
+    # columns (day - 1); daily_totals is the column sum over job types
+    summary: dict[int, list[float]] = {jt.id: [0.0] * len(dates) for jt in job_types}
+    daily_totals: list[float] = [0.0] * len(dates)
+
+    for emp_id, d, jt_id, work_type, headcount, is_requested in assignments:
+        if jt_id and work_type != "off":
+            name = jt_map.get(jt_id, "")
+            if work_type == "morning_half":
                 name += "(午前)"
-            elif a.work_type == "afternoon_half":
+            elif work_type == "afternoon_half":
                 name += "(午後)"
-            matrix[a.employee_id][a.date] = name
+            cell = (name, jt_id)
             # Accumulate summary
-            summary[a.job_type_id][a.date] += a.headcount_value
-            daily_totals[a.date] += a.headcount_value
+            col = d.day - 1
+            summary[jt_id][col] += headcount
+            daily_totals[col] += headcount
+        elif is_requested:
+            cell = _REQUESTED_OFF_CELL
         else:
-            if (a.employee_id, a.date) in requested_off:
-                matrix[a.employee_id][a.date] = "希休"
-            else:
-                matrix[a.employee_id][a.date] = "調休"
+            cell = _ADJUSTED_OFF_CELL
+        # Staff no longer listed still count towards the summary rows above
+        row_idx = emp_row_idx.get(emp_id)
+        if row_idx is not None:
+            grid[row_idx][d.day - 1] = cell
+
+    return employees, dates, grid, job_types, summary, daily_totals
 
-    return employees, dates, matrix, job_types, summary, daily_totals
 
+_EMPTY_CELL = ("", None)
+_REQUESTED_OFF_CELL = ("希休", None)
+_ADJUSTED_OFF_CELL = ("調休", None)
 
-def _split_dates(dates: list[date]) -> tuple[list[date], list[date]]:
+
+def _split_dates(dates: tuple[date, ...]) -> tuple[list[date], list[date]]:
     """Split dates into first half (day 1-15) and second half (day 16-end)."""
     first_half = [d for d in dates if d.day <= 15]
     second_half = [d for d in dates if d.day > 15]
     return first_half, second_half
 
 
+_WEEKDAY_NAMES = ("月", "火", "水", "木", "金", "土", "日")
+
+
+@lru_cache(maxsize=64)
+def _date_meta(dates: tuple[date, ...]) -> tuple[tuple[str, bool], ...]:
+    """(weekday name, is weekend) per date, aligned with the grid columns."""
+    return tuple((_WEEKDAY_NAMES[d.weekday()], d.weekday() >= 5) for d in dates)
+
+
+def _grid_cols(date_slice: list[date]) -> slice:
+    """Grid column range of a half-month slice (columns are day - 1)."""
+    return slice(date_slice[0].day - 1, date_slice[-1].day)
+
+
 def _fmt_val(val: float) -> str:
     """Format a summary value: integer if whole, one decimal otherwise, empty if 0."""
     if val == 0:
@@ -103,162 +199,193 @@ def _fmt_val(val: float) -> str:
 # CSV
 # ---------------------------------------------------------------------------
 
-def generate_csv(db: Session, month: str) -> str:
-    employees, dates, matrix, job_types, summary, daily_totals = _get_schedule_data(db, month)
-    first_half, second_half = _split_dates(dates)
+class _Echo:
+    """Pseudo-file for csv.writer: write() just hands the formatted row back."""
+
+    def write(self, value: str) -> str:
+        return value
+
 
-    output = io.StringIO()
-    writer = csv.writer(output)
+def iter_csv_rows(db: Session, month: str) -> Iterator[bytes]:
+    """Return an iterator over UTF-8 CSV chunks, starting with a BOM for Excel.
 
-    weekday_names = ["月", "火", "水", "木", "金", "土", "日"]
+    Each half-month block is encoded and yielded as one chunk. The schedule
+    data is loaded eagerly so a missing schedule raises ValueError here,
+    before any response bytes are streamed.
+    """
+    data = _get_schedule_data(db, month)
+    return _iter_csv(*data)
+
+
+def _iter_csv(employees, dates, grid, job_types, summary, daily_totals) -> Iterator[bytes]:
+    first_half, second_half = _split_dates(dates)
+    writer = csv.writer(_Echo())
+    meta = _date_meta(dates)
 
+    lines = ["\ufeff"]
     for date_slice in [first_half, second_half]:
+        cols = _grid_cols(date_slice)
+
         # Header
-        header = ["スタッフ"] + [f"{d.day}({weekday_names[d.weekday()]})" for d in date_slice]
-        writer.writerow(header)
+        header = ["スタッフ"] + [f"{d.day}({wd})" for d, (wd, _) in zip(date_slice, meta[cols])]
+        lines.append(writer.writerow(header))
 
         # Employee rows
-        for emp in employees:
-            row = [emp.name]
-            for d in date_slice:
-                row.append(matrix.get(emp.id, {}).get(d, ""))
-            writer.writerow(row)
+        for emp, grid_row in zip(employees, grid):
+            lines.append(writer.writerow([emp.name] + [label for label, _ in grid_row[cols]]))
 
         # Summary rows per job type
         for jt in job_types:
-            row = [jt.name]
-            for d in date_slice:
-                row.append(_fmt_val(summary[jt.id][d]))
-            writer.writerow(row)
+            lines.append(writer.writerow([jt.name] + [_fmt_val(v) for v in summary[jt.id][cols]]))
 
         # Daily total row
-        total_row = ["合計"]
-        for d in date_slice:
-            total_row.append(_fmt_val(daily_totals[d]))
-        writer.writerow(total_row)
+        lines.append(writer.writerow(["合計"] + [_fmt_val(v) for v in daily_totals[cols]]))
 
         # Blank separator between halves
-        writer.writerow([])
+        lines.append(writer.writerow([]))
 
-    return output.getvalue()
+        # One encode and one ASGI body message per block instead of per row
+        yield "".join(lines).encode("utf-8")
+        lines = []
 
 
 # ---------------------------------------------------------------------------
 # Excel
 # ---------------------------------------------------------------------------
 
-def generate_excel(db: Session, month: str) -> bytes:
-    employees, dates, matrix, job_types, summary, daily_totals = _get_schedule_data(db, month)
+def _xl_format_cache(wb: xlsxwriter.Workbook):
+    """Return fmt(...) that creates each distinct cell format once per workbook."""
+    cache = {}
+
+    def fmt(bold=False, color=None, bg=None, center=False, wrap=False):
+        key = (bold, color, bg, center, wrap)
+        f = cache.get(key)
+        if f is None:
+            props = {"font_size": 8, "border": 1}
+            if bold:
+                props["bold"] = True
+            if color:
+                props["font_color"] = f"#{color}"
+            if bg:
+                props["bg_color"] = f"#{bg}"
+                props["pattern"] = 1
+            if center:
+                props["align"] = "center"
+            if wrap:
+                props["text_wrap"] = True
+            f = cache[key] = wb.add_format(props)
+        return f
+
+    return fmt
+
+
+def generate_excel(db: Session, month: str, out: BinaryIO) -> None:
+    """Write the month's schedule as .xlsx into the binary file-like `out`."""
+    employees, dates, grid, job_types, summary, daily_totals = _get_schedule_data(db, month)
     first_half, second_half = _split_dates(dates)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"シフト表 {month}"
-
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin'),
-    )
-
-    weekday_names = ["月", "火", "水", "木", "金", "土", "日"]
-    current_row = 1
+    # constant_memory flushes each row as soon as the next one starts, so rows
+    # must be written strictly top to bottom
+    wb = xlsxwriter.Workbook(out, {"constant_memory": True})
+    ws = wb.add_worksheet(f"シフト表 {month}")
+    fmt = _xl_format_cache(wb)
+
+    ws.set_column(0, 0, 12)
+    ws.set_column(1, max(len(first_half), len(second_half)), 6)
+
+    meta = _date_meta(dates)
+    # Every format is resolved here; the row loops below only reference them
+    bold_fmt = fmt(bold=True)
+    name_fmt = fmt()
+    header_fmt = fmt(bold=True, center=True, wrap=True)
+    header_weekend_fmt = fmt(bold=True, bg="D9D9D9", center=True, wrap=True)
+    weekend_fmt = fmt(center=True, bg="D9D9D9")
+    requested_off_fmt = fmt(center=True, bg="E9D5FF", color="7C3AED")
+    adjusted_off_fmt = fmt(center=True, bg="E2E8F0", color="64748B")
+    plain_fmt = fmt(center=True)
+    summary_fmt = fmt(bg="F0F0F0", center=True)
+    total_name_fmt = fmt(bold=True, bg="E0E0E0")
+    total_fmt = fmt(bold=True, bg="E0E0E0", center=True)
+    jt_fmt_by_id = {
+        jt.id: fmt(center=True, bg=JOB_TYPE_COLORS.get(jt.name)) for jt in job_types
+    }
+    jt_name_fmt_by_id = {
+        jt.id: fmt(bold=True, color=JOB_TYPE_COLORS.get(jt.name, "000000"), bg="F0F0F0")
+        for jt in job_types
+    }
+    row = 0
 
     for date_slice in [first_half, second_half]:
+        cols = _grid_cols(date_slice)
+        # Weekend columns are gray whatever the cell holds
+        weekend = [is_weekend for _, is_weekend in meta[cols]]
+        day_labels = [f"{d.day}\n{wd}" for d, (wd, _) in zip(date_slice, meta[cols])]
+
         # Header row
-        hdr_cell = ws.cell(row=current_row, column=1, value="スタッフ")
-        hdr_cell.font = Font(bold=True, size=8)
-        hdr_cell.border = thin_border
-        ws.column_dimensions['A'].width = 12
-
-        for col_idx, d in enumerate(date_slice, start=2):
-            cell = ws.cell(row=current_row, column=col_idx)
-            cell.value = f"{d.day}\n{weekday_names[d.weekday()]}"
-            cell.font = Font(bold=True, size=8)
-            cell.alignment = Alignment(horizontal='center', wrap_text=True)
-            cell.border = thin_border
-            ws.column_dimensions[cell.column_letter].width = 6
-            if d.weekday() >= 5:
-                cell.fill = PatternFill(start_color="D9D9D9", fill_type="solid")
-        current_row += 1
+        ws.write_string(row, 0, "スタッフ", bold_fmt)
+        for col, (label, is_weekend) in enumerate(zip(day_labels, weekend), start=1):
+            ws.write_string(row, col, label, header_weekend_fmt if is_weekend else header_fmt)
+        row += 1
 
         # Employee data rows
-        for emp in employees:
-            ws.cell(row=current_row, column=1, value=emp.name).border = thin_border
-            ws.cell(row=current_row, column=1).font = Font(size=8)
-            for col_idx, d in enumerate(date_slice, start=2):
-                cell = ws.cell(row=current_row, column=col_idx)
-                val = matrix.get(emp.id, {}).get(d, "")
-                cell.value = val
-                cell.alignment = Alignment(horizontal='center')
-                cell.border = thin_border
-                cell.font = Font(size=8)
-
-                if d.weekday() >= 5:
-                    cell.fill = PatternFill(start_color="D9D9D9", fill_type="solid")
-                elif val == "希休":
-                    cell.fill = PatternFill(start_color="E9D5FF", fill_type="solid")
-                    cell.font = Font(size=8, color="7C3AED")
-                elif val == "調休":
-                    cell.fill = PatternFill(start_color="E2E8F0", fill_type="solid")
-                    cell.font = Font(size=8, color="64748B")
-                elif val:
-                    for jt_name, color in JOB_TYPE_COLORS.items():
-                        if jt_name in val:
-                            cell.fill = PatternFill(start_color=color, fill_type="solid")
-                            break
-            current_row += 1
+        for emp, grid_row in zip(employees, grid):
+            ws.write_string(row, 0, emp.name, name_fmt)
+            for col, (cell, is_weekend) in enumerate(zip(grid_row[cols], weekend), start=1):
+                val, jt_id = cell
+                if is_weekend:
+                    cell_fmt = weekend_fmt
+                elif cell is _REQUESTED_OFF_CELL:
+                    cell_fmt = requested_off_fmt
+                elif cell is _ADJUSTED_OFF_CELL:
+                    cell_fmt = adjusted_off_fmt
+                else:
+                    cell_fmt = jt_fmt_by_id.get(jt_id, plain_fmt)
+                ws.write_string(row, col, val, cell_fmt)
+            row += 1
 
         # Summary rows per job type
         for jt in job_types:
-            name_cell = ws.cell(row=current_row, column=1, value=jt.name)
-            name_cell.border = thin_border
-            jt_hex = JOB_TYPE_COLORS.get(jt.name)
-            name_cell.font = Font(size=8, bold=True, color=jt_hex if jt_hex else "000000")
-            name_cell.fill = PatternFill(start_color="F0F0F0", fill_type="solid")
-            for col_idx, d in enumerate(date_slice, start=2):
-                cell = ws.cell(row=current_row, column=col_idx)
-                cell.value = _fmt_val(summary[jt.id][d]) or None
-                cell.alignment = Alignment(horizontal='center')
-                cell.border = thin_border
-                cell.font = Font(size=8)
-                cell.fill = PatternFill(start_color="F0F0F0", fill_type="solid")
-            current_row += 1
+            ws.write_string(row, 0, jt.name, jt_name_fmt_by_id[jt.id])
+            ws.write_row(row, 1, [_fmt_val(v) or None for v in summary[jt.id][cols]], summary_fmt)
+            row += 1
 
         # Daily total row
-        total_name = ws.cell(row=current_row, column=1, value="合計")
-        total_name.border = thin_border
-        total_name.font = Font(size=8, bold=True)
-        total_name.fill = PatternFill(start_color="E0E0E0", fill_type="solid")
-        for col_idx, d in enumerate(date_slice, start=2):
-            cell = ws.cell(row=current_row, column=col_idx)
-            cell.value = _fmt_val(daily_totals[d]) or None
-            cell.alignment = Alignment(horizontal='center')
-            cell.border = thin_border
-            cell.font = Font(size=8, bold=True)
-            cell.fill = PatternFill(start_color="E0E0E0", fill_type="solid")
-        current_row += 1
+        ws.write_string(row, 0, "合計", total_name_fmt)
+        ws.write_row(row, 1, [_fmt_val(v) or None for v in daily_totals[cols]], total_fmt)
+        row += 1
 
         # Gap between halves
-        current_row += 2
+        row += 2
 
-    output = io.BytesIO()
-    wb.save(output)
-    return output.getvalue()
+    wb.close()
 
 
 # ---------------------------------------------------------------------------
 # PDF
 # ---------------------------------------------------------------------------
 
-def generate_pdf(db: Session, month: str) -> bytes:
-    employees, dates, matrix, job_types, summary, daily_totals = _get_schedule_data(db, month)
+# PDF colors, created once at import. Cell styles are (background, text color)
+_PDF_JT_STYLES = {
+    "職人": (colors.Color(1.0, 0.42, 0.42), None),
+    "サブ職人": (colors.Color(0.3, 0.67, 0.97), None),
+    "データ": (colors.Color(0.32, 0.81, 0.4), None),
+    "その他": (colors.Color(1.0, 0.83, 0.23), None),
+}
+_PDF_REQUESTED_OFF_COLORS = (colors.Color(0.91, 0.84, 1.0), colors.Color(0.49, 0.23, 0.93))
+_PDF_ADJUSTED_OFF_COLORS = (colors.Color(0.89, 0.91, 0.94), colors.Color(0.39, 0.45, 0.55))
+_PDF_HEADER_BG = colors.Color(0.9, 0.9, 0.9)
+_PDF_WEEKEND_BG = colors.Color(0.85, 0.85, 0.85)
+_PDF_SUMMARY_BG = colors.Color(0.94, 0.94, 0.94)
+_PDF_TOTAL_BG = colors.Color(0.88, 0.88, 0.88)
+
+
+def generate_pdf(db: Session, month: str, out: BinaryIO) -> None:
+    """Write the month's schedule as PDF into the binary file-like `out`."""
+    employees, dates, grid, job_types, summary, daily_totals = _get_schedule_data(db, month)
     first_half, second_half = _split_dates(dates)
 
-    output = io.BytesIO()
     doc = SimpleDocTemplate(
-        output,
+        out,
         pagesize=landscape(A3),
         leftMargin=10 * mm,
         rightMargin=10 * mm,
@@ -266,47 +393,42 @@ def generate_pdf(db: Session, month: str) -> bytes:
         bottomMargin=10 * mm,
     )
 
-    # Try to register a Japanese font
-    _try_register_japanese_font()
-    font_name = _get_japanese_font_name()
+    # Try to register a Japanese font (only probed on the first export)
+    font_name = _try_register_japanese_font()
 
-    weekday_names = ["月", "火", "水", "木", "金", "土", "日"]
+    meta = _date_meta(dates)
 
-    jt_colors_rgb = {
-        "職人": colors.Color(1.0, 0.42, 0.42),
-        "サブ職人": colors.Color(0.3, 0.67, 0.97),
-        "データ": colors.Color(0.32, 0.81, 0.4),
-        "その他": colors.Color(1.0, 0.83, 0.23),
+    # (background, text color) per style key: the job type id for work cells,
+    # the shared sentinel cell for days off; unstyled keys are absent
+    cell_styles: dict = {
+        jt.id: _PDF_JT_STYLES[jt.name] for jt in job_types if jt.name in _PDF_JT_STYLES
     }
+    cell_styles[_REQUESTED_OFF_CELL] = _PDF_REQUESTED_OFF_COLORS
+    cell_styles[_ADJUSTED_OFF_CELL] = _PDF_ADJUSTED_OFF_COLORS
 
     elements = []
 
     for date_slice in [first_half, second_half]:
+        cols = _grid_cols(date_slice)
+        slice_meta = meta[cols]
+
         # Build header
-        header = [""] + [f"{d.day}\n{weekday_names[d.weekday()]}" for d in date_slice]
+        header = [""] + [f"{d.day}\n{wd}" for d, (wd, _) in zip(date_slice, slice_meta)]
         data = [header]
 
         # Employee rows
-        for emp in employees:
-            row = [emp.name]
-            for d in date_slice:
-                row.append(matrix.get(emp.id, {}).get(d, ""))
-            data.append(row)
+        cells = [grid_row[cols] for grid_row in grid]
+        for emp, emp_cells in zip(employees, cells):
+            data.append([emp.name] + [label for label, _ in emp_cells])
 
         num_emp_rows = len(employees)
 
         # Summary rows per job type
         for jt in job_types:
-            row = [jt.name]
-            for d in date_slice:
-                row.append(_fmt_val(summary[jt.id][d]))
-            data.append(row)
+            data.append([jt.name] + [_fmt_val(v) for v in summary[jt.id][cols]])
 
         # Daily total row
-        total_row = ["合計"]
-        for d in date_slice:
-            total_row.append(_fmt_val(daily_totals[d]))
-        data.append(total_row)
+        data.append(["合計"] + [_fmt_val(v) for v in daily_totals[cols]])
 
         # Column widths
         name_width = 50
@@ -321,94 +443,110 @@ def generate_pdf(db: Session, month: str) -> bytes:
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
             ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.9, 0.9, 0.9)),
+            ('BACKGROUND', (0, 0), (-1, 0), _PDF_HEADER_BG),
         ]
 
         # Use Japanese font if available
         if font_name:
             style_cmds.append(('FONTNAME', (0, 0), (-1, -1), font_name))
-            style_cmds.append(('FONTNAME', (0, 0), (-1, 0), font_name))
         else:
             style_cmds.append(('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'))
 
         # Weekend column coloring
-        for col_idx, d in enumerate(date_slice):
-            if d.weekday() >= 5:
+        for col_idx, (_, is_weekend) in enumerate(slice_meta):
+            if is_weekend:
                 style_cmds.append(
-                    ('BACKGROUND', (col_idx + 1, 0), (col_idx + 1, -1),
-                     colors.Color(0.85, 0.85, 0.85))
+                    ('BACKGROUND', (col_idx + 1, 0), (col_idx + 1, -1), _PDF_WEEKEND_BG)
                 )
 
         # Employee cell coloring (rows 1 .. num_emp_rows)
-        for row_idx, emp in enumerate(employees, start=1):
-            for col_idx, d in enumerate(date_slice):
-                val = matrix.get(emp.id, {}).get(d, "")
-                if val == "希休":
-                    style_cmds.append(
-                        ('BACKGROUND', (col_idx + 1, row_idx), (col_idx + 1, row_idx),
-                         colors.Color(0.91, 0.84, 1.0)))
-                    style_cmds.append(
-                        ('TEXTCOLOR', (col_idx + 1, row_idx), (col_idx + 1, row_idx),
-                         colors.Color(0.49, 0.23, 0.93)))
-                elif val == "調休":
-                    style_cmds.append(
-                        ('BACKGROUND', (col_idx + 1, row_idx), (col_idx + 1, row_idx),
-                         colors.Color(0.89, 0.91, 0.94)))
-                    style_cmds.append(
-                        ('TEXTCOLOR', (col_idx + 1, row_idx), (col_idx + 1, row_idx),
-                         colors.Color(0.39, 0.45, 0.55)))
-                else:
-                    for jt_name, color in jt_colors_rgb.items():
-                        if jt_name in val:
-                            style_cmds.append(
-                                ('BACKGROUND', (col_idx + 1, row_idx), (col_idx + 1, row_idx), color))
-                            break
+        style_cmds.extend(_pdf_cell_style_cmds(cells, cell_styles))
 
         # Summary rows styling (light gray background)
         summary_start = 1 + num_emp_rows
         summary_end = summary_start + len(job_types)  # total row index
         style_cmds.append(
-            ('BACKGROUND', (0, summary_start), (-1, summary_end - 1),
-             colors.Color(0.94, 0.94, 0.94)))
+            ('BACKGROUND', (0, summary_start), (-1, summary_end - 1), _PDF_SUMMARY_BG))
         # Total row slightly darker
         style_cmds.append(
-            ('BACKGROUND', (0, summary_end), (-1, summary_end),
-             colors.Color(0.88, 0.88, 0.88)))
+            ('BACKGROUND', (0, summary_end), (-1, summary_end), _PDF_TOTAL_BG))
 
         table.setStyle(TableStyle(style_cmds))
         elements.append(table)
         elements.append(Spacer(1, 8 * mm))
 
     doc.build(elements)
-    return output.getvalue()
-
-
-def _try_register_japanese_font():
-    """Try to register a Japanese font for PDF generation."""
-    font_paths = [
-        # Windows
-        "C:/Windows/Fonts/msgothic.ttc",
-        "C:/Windows/Fonts/meiryo.ttc",
-        # macOS
-        "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
-        "/Library/Fonts/Arial Unicode.ttf",
-        # Linux
-        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
-        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-    ]
-    for path in font_paths:
-        if os.path.exists(path):
-            try:
-                pdfmetrics.registerFont(TTFont("JapaneseFont", path))
-                return
-            except Exception:
-                continue
 
 
-def _get_japanese_font_name() -> str | None:
-    """Return registered Japanese font name if available."""
-    try:
-        pdfmetrics.getFont("JapaneseFont")
-        return "JapaneseFont"
-    except KeyError:
+def _pdf_cell_style_cmds(cells: list[list[tuple[str, int | None]]], cell_styles: dict) -> list[tuple]:
+    """BACKGROUND/TEXTCOLOR commands for the employee cells (table rows 1..n).
+
+    Same-style cells are merged into vertical runs per column, and identical
+    runs in adjacent columns into one rectangle, so the command count follows
+    the number of color blocks rather than rows x days.
+    """
+    cmds = []
+
+    def emit(run, first_col, last_col):
+        row_start, row_end, style_key = run
+        bg, text = cell_styles[style_key]
+        cmds.append(('BACKGROUND', (first_col, row_start), (last_col, row_end), bg))
+        if text is not None:
+            cmds.append(('TEXTCOLOR', (first_col, row_start), (last_col, row_end), text))
+
+    # (row_start, row_end, style_key) -> first table column of the rectangle
+    open_runs: dict[tuple, int] = {}
+    num_cols = len(cells[0]) if cells else 0
+    for col in range(1, num_cols + 1):
+        col_runs = []
+        run_start, run_key = 1, None
+        for row_idx in range(1, len(cells) + 2):
+            key = None
+            if row_idx <= len(cells):
+                cell = cells[row_idx - 1][col - 1]
+                key = cell if cell[1] is None else cell[1]
+                if key not in cell_styles:
+                    key = None
+            if key == run_key:
+                continue
+            if run_key is not None:
+                col_runs.append((run_start, row_idx - 1, run_key))
+            run_start, run_key = row_idx, key
+        continuing = set(col_runs)
+        for run in [r for r in open_runs if r not in continuing]:
+            emit(run, open_runs.pop(run), col - 1)
+        for run in col_runs:
+            open_runs.setdefault(run, col)
+    for run, first_col in open_runs.items():
+        emit(run, first_col, num_cols)
+    return cmds
+
+
+_JAPANESE_FONT_PATHS = [
+    # Windows
+    "C:/Windows/Fonts/msgothic.ttc",
+    "C:/Windows/Fonts/meiryo.ttc",
+    # macOS
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    "/Library/Fonts/Arial Unicode.ttf",
+    # Linux
+    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+]
+_font_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _try_register_japanese_font() -> str | None:
+    """Register a Japanese font for PDF generation once; return its name or None."""
+    with _font_lock:
+        if "JapaneseFont" in pdfmetrics.getRegisteredFontNames():
+            return "JapaneseFont"
+        for path in _JAPANESE_FONT_PATHS:
+            if os.path.exists(path):
+                try:
+                    pdfmetrics.registerFont(TTFont("JapaneseFont", path))
+                    return "JapaneseFont"
+                except Exception:
+                    continue
         return None
@@ -1,64 +1,55 @@
 import os
-import json
+import re
+from functools import lru_cache
 from pathlib import Path
-from anthropic import Anthropic
+from typing import Any
+from anthropic import Anthropic, DefaultHttpxClient
 from dotenv import load_dotenv
+from pydantic import TypeAdapter, ValidationError
 
 load_dotenv(Path(__file__).resolve().parent.parent / ".env")
 
+# Trailing commas before ] or } (common LLM output issue)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+# Body of the first ``` fenced block: the opening fence line (with any language
+# tag) is skipped, and an unclosed block runs to the end of the text
+_FENCE_RE = re.compile(r"```[^\n]*\n(.*?)(?:```|\Z)", re.S)
+# The reply must be a JSON array of objects; pydantic-core parses and checks
+# the shape in one pass, so a stray top-level object or scalar fails here
+# instead of deep in the router
+_MODIFICATIONS = TypeAdapter(list[dict[str, Any]])
 
-def parse_modification(input_text: str, current_summary: str, schedule_detail: str = "", target_month: str = "") -> list[dict]:
-    """
-    Use Claude API to parse a natural language shift modification request
-    into structured constraint data.
-
-    schedule_detail: per-employee daily schedule (e.g. "若生亜紀子: 3/2=データ, 3/3=休み, ...")
-    target_month: schedule month in "YYYY-MM" format (e.g. "2026-03")
-    """
-    api_key = os.getenv("ANTHROPIC_API_KEY", "")
-    if not api_key or api_key == "your-api-key-here":
-        raise ValueError("ANTHROPIC_API_KEY が設定されていません。backend/.env ファイルを確認してください。")
 
-    client = Anthropic(api_key=api_key)
-
-    prompt = f"""あなたはシフト修正指示を解析するアシスタントです。
+# Fixed parts of the prompt, built once; only the schedule-specific middle
+# section is formatted per call
+_PROMPT_HEAD = """あなたはシフト修正指示を解析するアシスタントです。
 ユーザーの指示を読み、必要最小限の変更だけをJSON配列で出力してください。
 
 ## 対象スケジュール月
-{target_month}
-※ ユーザーが「3/2」と言った場合、日付は「{target_month}-02」です。月と年は必ずこの対象月に合わせてください。
+"""
 
-## ユーザーの修正指示
-{input_text}
-
-## 現在のシフト概要
-{current_summary}
-
-## 現在の日別スケジュール
-{schedule_detail}
-
-## 出力形式
+_PROMPT_TAIL = """## 出力形式
 
 2種類の変更タイプがあります。指示内容に応じて適切なタイプを選んでください。
 
 ### タイプ1: pin（特定日の直接変更）— 最も一般的
 特定のスタッフの特定日を変更する場合に使います。
-{{
+{
   "type": "pin",
   "employee_name": "スタッフ名",
   "date": "YYYY-MM-DD",
   "new_job_type": "職人" / "サブ職人" / "データ" / "その他" / "休み"
-}}
+}
 
 ### タイプ2: adjust（集計的な変更）
 「もっとデータを増やして」のような日付を指定しない調整に使います。
-{{
+{
   "type": "adjust",
   "employee_name": "スタッフ名",
   "job_type": "職人" / "サブ職人" / "データ" / "その他",
   "action": "increase" / "decrease" / "set",
   "amount": 数値またはnull
-}}
+}
 
 ## 重要なルール
 - employee_nameは現在のシフト情報に含まれるフルネームを出力してください。ユーザーが「植原」「大野」のように苗字だけで指定した場合、シフト情報からフルネーム（例: 「植原ふみ代」「大野千絵美」）を探して出力してください
@@ -70,6 +61,49 @@ def parse_modification(input_text: str, current_summary: str, schedule_detail: s
 - すべての指示を漏れなく出力してください。指示を無視しないでください
 - JSON配列のみを出力してください。説明文は不要です。"""
 
+
+@lru_cache(maxsize=1)
+def _get_client(api_key: str) -> Anthropic:
+    """One client per API key, so its HTTP connection pool is reused across requests.
+
+    The pool speaks HTTP/2, so concurrent parses share one TLS connection.
+    DefaultHttpxClient keeps the SDK's own timeout and connection limits.
+    """
+    return Anthropic(api_key=api_key, http_client=DefaultHttpxClient(http2=True))
+
+
+def parse_modification(input_text: str, current_summary: str, schedule_detail: str = "", target_month: str = "") -> list[dict]:
+    """
+    Use Claude API to parse a natural language shift modification request
+    into structured constraint data.
+
+    schedule_detail: per-employee daily schedule (e.g. "若生亜紀子: 3/2=データ, 3/3=休み, ...")
+    target_month: schedule month in "YYYY-MM" format (e.g. "2026-03")
+    """
+    api_key = os.getenv("ANTHROPIC_API_KEY", "")
+    if not api_key or api_key == "your-api-key-here":
+        raise ValueError("ANTHROPIC_API_KEY が設定されていません。backend/.env ファイルを確認してください。")
+
+    client = _get_client(api_key)
+
+    prompt = (
+        _PROMPT_HEAD
+        + f"""{target_month}
+※ ユーザーが「3/2」と言った場合、日付は「{target_month}-02」です。月と年は必ずこの対象月に合わせてください。
+
+## ユーザーの修正指示
+{input_text}
+
+## 現在のシフト概要
+{current_summary}
+
+## 現在の日別スケジュール
+{schedule_detail}
+
+"""
+        + _PROMPT_TAIL
+    )
+
     try:
         message = client.messages.create(
             model="claude-sonnet-4-20250514",
@@ -87,19 +121,9 @@ def parse_modification(input_text: str, current_summary: str, schedule_detail: s
     response_text = message.content[0].text.strip()
 
     # Extract JSON from response (handle ```json ... ``` blocks)
-    if "```" in response_text:
-        lines = response_text.split("\n")
-        json_lines = []
-        in_block = False
-        for line in lines:
-            if line.strip().startswith("```") and not in_block:
-                in_block = True
-                continue
-            elif line.strip().startswith("```") and in_block:
-                break
-            elif in_block:
-                json_lines.append(line)
-        response_text = "\n".join(json_lines)
+    fence = _FENCE_RE.search(response_text)
+    if fence:
+        response_text = fence.group(1)
 
     # Extract JSON array even if surrounded by extra text
     start = response_text.find("[")
@@ -108,7 +132,9 @@ def parse_modification(input_text: str, current_summary: str, schedule_detail: s
         response_text = response_text[start:end + 1]
 
     # Remove trailing commas before ] or } (common LLM output issue)
-    import re
-    response_text = re.sub(r",\s*([}\]])", r"\1", response_text)
+    response_text = _TRAILING_COMMA_RE.sub(r"\1", response_text)
 
-    return json.loads(response_text)
+    try:
+        return _MODIFICATIONS.validate_json(response_text)
+    except ValidationError:
+        raise ValueError("AIの応答を解析できませんでした。指示を言い換えて再度お試しください。")
@@ -24,14 +24,31 @@ Soft constraints (objective function):
 """
 
 from ortools.sat.python import cp_model
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 from database import (
-    Employee, EmployeeJobType, ShiftRequest, RequestDetail,
+    Employee, EmployeeJobType, JobType, ShiftRequest, RequestDetail,
     DailyRequirement, Schedule, ShiftAssignment,
 )
-from routers.holidays import is_non_working_day
+from routers.holidays import working_days_in_month
 from datetime import date, timedelta
 import calendar
+import os
+
+# CP-SAT runs a portfolio of search strategies in parallel, one per worker
+_NUM_WORKERS = int(os.getenv("OPTIMIZER_NUM_WORKERS", str(min(16, os.cpu_count() or 8))))
+
+# Optional search tuning; unset keeps CP-SAT's defaults (linearization_level=1,
+# symmetry_level=2, optimize_with_core off), which measured best on our data
+_SOLVER_TUNING: dict[str, int | bool] = {
+    name: (value.lower() in ("1", "true", "yes") if name == "optimize_with_core" else int(value))
+    for name, value in (
+        ("linearization_level", os.getenv("OPTIMIZER_LINEARIZATION_LEVEL")),
+        ("symmetry_level", os.getenv("OPTIMIZER_SYMMETRY_LEVEL")),
+        ("optimize_with_core", os.getenv("OPTIMIZER_OPTIMIZE_WITH_CORE")),
+    )
+    if value
+}
 
 
 def generate_schedule(
@@ -47,7 +64,7 @@ def generate_schedule(
     year, mon = map(int, month.split("-"))
     days_in_month = calendar.monthrange(year, mon)[1]
     all_dates = [date(year, mon, d) for d in range(1, days_in_month + 1)]
-    working_dates = [d for d in all_dates if not is_non_working_day(d)]
+    working_dates = working_days_in_month(year, mon)  # cached per month
 
     # Load data
     employees = db.query(Employee).order_by(Employee.sort_order).all()
@@ -58,11 +75,16 @@ def generate_schedule(
     emp_names = {e.id: e.name for e in employees}
     emp_type = {e.id: e.employment_type for e in employees}
 
-    # Employee -> allowed job type ids
-    emp_job_types: dict[int, list[int]] = {}
-    for e in employees:
-        ejts = db.query(EmployeeJobType).filter(EmployeeJobType.employee_id == e.id).all()
-        emp_job_types[e.id] = [ejt.job_type_id for ejt in ejts]
+    # Employee -> allowed job type ids (one query for all staff). Ids are kept
+    # unique: a repeated id would put the same x variable twice into HC-02
+    emp_job_types: dict[int, list[int]] = {e_id: [] for e_id in emp_ids}
+    for e_id, jt_id in db.execute(
+        select(EmployeeJobType.employee_id, EmployeeJobType.job_type_id)
+        .where(EmployeeJobType.employee_id.in_(emp_ids))
+        .order_by(EmployeeJobType.id)
+    ):
+        if jt_id not in emp_job_types[e_id]:
+            emp_job_types[e_id].append(jt_id)
 
     # All job type ids used in requirements
     all_job_type_ids = sorted(
@@ -71,31 +93,40 @@ def generate_schedule(
     if not all_job_type_ids:
         raise ValueError("No job types assigned to any employee")
 
-    # Requested days off per employee (with period info)
-    emp_off_periods: dict[int, dict[date, set[str]]] = {}  # e_id -> date -> {"am","pm"}
-    emp_requested_work: dict[int, str | None] = {}  # "1"-"23" or "max" or None
-
+    # Inverted index: job type -> qualified staff (in sort order), so per-day
+    # constraints below scan only the candidates for that job type
+    job_to_emps: dict[int, list[int]] = {j: [] for j in all_job_type_ids}
     for e_id in emp_ids:
-        req = (
-            db.query(ShiftRequest)
-            .filter(ShiftRequest.employee_id == e_id, ShiftRequest.target_month == month)
-            .first()
-        )
-        if req:
-            details = db.query(RequestDetail).filter(RequestDetail.shift_request_id == req.id).all()
-            off_periods: dict[date, set[str]] = {}
-            for d in details:
-                if d.date not in off_periods:
-                    off_periods[d.date] = set()
-                if d.period == "all_day":
-                    off_periods[d.date].update({"am", "pm"})
-                else:
-                    off_periods[d.date].add(d.period)
-            emp_off_periods[e_id] = off_periods
-            emp_requested_work[e_id] = str(req.requested_work_days) if req.requested_work_days is not None else None
+        for j in emp_job_types[e_id]:
+            job_to_emps[j].append(e_id)
+
+    # Job type names, shared by HC-06, NLP constraints and the reports below
+    jt_name_map = dict(db.execute(select(JobType.id, JobType.name)).all())
+
+    # Requested days off per employee (with period info)
+    emp_off_periods: dict[int, dict[date, set[str]]] = {e_id: {} for e_id in emp_ids}  # e_id -> date -> {"am","pm"}
+    emp_requested_work: dict[int, str | None] = {e_id: None for e_id in emp_ids}  # "1"-"23" or "max" or None
+
+    # The month's requests and their day-off details, one query each
+    # (the request upsert keeps at most one request per staff member and month)
+    for e_id, requested_work_days in db.execute(
+        select(ShiftRequest.employee_id, ShiftRequest.requested_work_days)
+        .where(ShiftRequest.target_month == month)
+    ):
+        if e_id in emp_requested_work:
+            emp_requested_work[e_id] = str(requested_work_days) if requested_work_days is not None else None
+    for e_id, d, period in db.execute(
+        select(ShiftRequest.employee_id, RequestDetail.date, RequestDetail.period)
+        .join(RequestDetail, RequestDetail.shift_request_id == ShiftRequest.id)
+        .where(ShiftRequest.target_month == month)
+    ):
+        if e_id not in emp_off_periods:
+            continue
+        off_periods = emp_off_periods[e_id].setdefault(d, set())
+        if period == "all_day":
+            off_periods.update({"am", "pm"})
         else:
-            emp_off_periods[e_id] = {}
-            emp_requested_work[e_id] = None
+            off_periods.add(period)
 
     # Derive full-day off set and half-day headcount factor
     emp_full_off: dict[int, set[date]] = {}  # dates with both am+pm off
@@ -133,78 +164,65 @@ def generate_schedule(
     # ---- Build CP-SAT Model ----
     model = cp_model.CpModel()
 
+    # 職人・サブ職人 (HC-06)
+    hard_one_jt_ids = {j for j, name in jt_name_map.items() if name in ("職人", "サブ職人")}
+
     # Decision variables: x[e, d, j] = 1 if employee e works on date d doing job j (full day)
-    # For simplicity, we model full-day assignments first
+    # HC-01 / HC-04 / HC-06 by construction: variables exist only for qualified job types,
+    # none on requested full days off, and half-day workers get none for 職人/サブ職人.
+    # A missing key is an assignment fixed to 0
     x = {}
     for e_id in emp_ids:
+        allowed = emp_job_types[e_id]
         for d in working_dates:
-            for j in all_job_type_ids:
+            if d in emp_full_off[e_id]:
+                continue
+            half_off = d in emp_half_off[e_id]
+            for j in allowed:
+                if half_off and j in hard_one_jt_ids:
+                    continue
                 x[e_id, d, j] = model.new_bool_var(f"x_{e_id}_{d}_{j}")
 
-    # work[e, d] = 1 if employee e works on date d (any job)
+    # work[e, d] = 1 if employee e works on date d (any job): a plain linear
+    # expression over that day's x, so no extra variable or linking constraint
+    # HC-02: At most one job type per day, as a native AtMostOne constraint
     work = {}
     for e_id in emp_ids:
         for d in working_dates:
-            work[e_id, d] = model.new_bool_var(f"work_{e_id}_{d}")
-
-    # Link work to x
-    for e_id in emp_ids:
-        for d in working_dates:
-            model.add(work[e_id, d] == sum(x[e_id, d, j] for j in all_job_type_ids))
-
-    # HC-01: Requested days off -> must not work (full day off only)
-    # Half-day off: employee can still work (headcount 0.5) — handled via emp_hc_factor
-    for e_id in emp_ids:
-        for d in working_dates:
-            if d in emp_full_off[e_id]:
-                model.add(work[e_id, d] == 0)
-
-    # HC-02: At most one job type per day (already implied by work = sum(x))
-    for e_id in emp_ids:
-        for d in working_dates:
-            model.add(sum(x[e_id, d, j] for j in all_job_type_ids) <= 1)
-
-    # HC-04: Only assign qualified job types
-    for e_id in emp_ids:
-        allowed = emp_job_types.get(e_id, [])
-        for d in working_dates:
-            for j in all_job_type_ids:
-                if j not in allowed:
-                    model.add(x[e_id, d, j] == 0)
+            day_vars = [x[e_id, d, j] for j in emp_job_types[e_id] if (e_id, d, j) in x]
+            model.add_at_most_one(day_vars)
+            work[e_id, d] = cp_model.LinearExpr.sum(day_vars)
 
     # HC-06: 職人・サブ職人は各営業日に必ず1名ずつ配置（ハード制約）
-    # 半日勤務者はフル勤務できないため、職人/サブ職人には割り当てない
-    from database import JobType
-    hard_one_jt_ids = set()
-    for jt in db.query(JobType).filter(JobType.name.in_(["職人", "サブ職人"])).all():
-        hard_one_jt_ids.add(jt.id)
+    # 半日勤務者の変数は作っていないため、フル勤務できる資格者の中から1名を選ぶ
     for d in working_dates:
         for j in hard_one_jt_ids:
             if j in all_job_type_ids:
-                # 半日勤務者はこの職種に割り当てない
-                for e_id in emp_ids:
-                    if d in emp_half_off[e_id] and j in emp_job_types.get(e_id, []):
-                        model.add(x[e_id, d, j] == 0)
-                model.add(
-                    sum(x[e_id, d, j] for e_id in emp_ids if j in emp_job_types.get(e_id, [])) == 1
-                )
+                model.add_exactly_one([x[e_id, d, j] for e_id in job_to_emps[j] if (e_id, d, j) in x])
+
+    # Headcount factor per staff member as a list aligned with working_dates,
+    # so the model loops index by day position instead of hashing dates
+    hc_factor = {e_id: [emp_hc_factor[e_id].get(d, 2) for d in working_dates] for e_id in emp_ids}
 
     # HC-03: Meet daily requirements (soft constraint with high penalty)
     # Using integer scaling: multiply by 2 for 0.5 support
     # Half-day workers contribute 1 unit (0.5), full-day workers contribute 2 units (1.0)
     violations = []
     shortage_vars = []  # Track shortages for objective penalty
-    for d in working_dates:
+    for d_idx, d in enumerate(working_dates):
         if d not in daily_reqs:
             continue
         for j, req_count in daily_reqs[d].items():
             if j in hard_one_jt_ids:
                 continue  # Already enforced as hard constraint above
             scaled_req = int(req_count * 2)
-            supply = sum(
-                x[e_id, d, j] * emp_hc_factor[e_id].get(d, 2)
-                for e_id in emp_ids
-                if j in emp_job_types.get(e_id, [])
+            if scaled_req <= 0:
+                continue  # Nothing required: the shortage would be fixed at 0
+            # Qualified staff on a requested full day off have no variable
+            candidates = [e_id for e_id in job_to_emps.get(j, ()) if (e_id, d, j) in x]
+            supply = cp_model.LinearExpr.weighted_sum(
+                [x[e_id, d, j] for e_id in candidates],
+                [hc_factor[e_id][d_idx] for e_id in candidates],
             )
             # Soft constraint: allow shortage but penalize heavily
             shortage = model.new_int_var(0, scaled_req, f"shortage_{d}_{j}")
@@ -214,8 +232,8 @@ def generate_schedule(
     # Apply extra constraints from NLP modifications
     if extra_constraints:
         for c in extra_constraints:
-            _apply_extra_constraint(model, x, work, c, emp_ids, emp_names,
-                                    working_dates, all_job_type_ids, emp_job_types, db)
+            _apply_extra_constraint(model, x, c, emp_ids, emp_names,
+                                    working_dates, all_job_type_ids, emp_job_types, jt_name_map)
 
     # ---- Soft constraints via objective ----
     total_working_dates = len(working_dates)
@@ -226,12 +244,16 @@ def generate_schedule(
     for e_id in emp_ids:
         emp_total_work[e_id] = model.new_int_var(0, scaled_total, f"tw_{e_id}")
         model.add(
-            emp_total_work[e_id] == sum(
-                work[e_id, d] * emp_hc_factor[e_id].get(d, 2) for d in working_dates
+            emp_total_work[e_id] == cp_model.LinearExpr.weighted_sum(
+                [work[e_id, d] for d in working_dates],
+                hc_factor[e_id],
             )
         )
 
-    objective_terms = []
+    # Objective as one flat weighted sum: each variable appears once with its
+    # combined weight, so no per-term expression objects are built
+    obj_vars = []
+    obj_coefs = []
 
     # SC-01: Deviation from requested work days (scaled by 2)
     for e_id in emp_ids:
@@ -240,14 +262,16 @@ def generate_schedule(
             # Maximize work days: penalize non-working days
             not_work_count = model.new_int_var(0, scaled_total, f"not_work_{e_id}")
             model.add(not_work_count == scaled_total - emp_total_work[e_id])
-            objective_terms.append(not_work_count * 10)
+            obj_vars.append(not_work_count)
+            obj_coefs.append(10)
         elif rw is not None:
             # Target specific number of work days (scaled by 2)
             target = int(rw) * 2
             dev = model.new_int_var(0, scaled_total, f"dev_work_{e_id}")
             model.add(dev >= emp_total_work[e_id] - target)
             model.add(dev >= target - emp_total_work[e_id])
-            objective_terms.append(dev * 10)
+            obj_vars.append(dev)
+            obj_coefs.append(10)
 
     # SC-03: Fairness - minimize max - min work days (scaled by 2)
     if len(emp_ids) > 1:
@@ -257,7 +281,8 @@ def generate_schedule(
         model.add_min_equality(min_work, [emp_total_work[e_id] for e_id in emp_ids])
         fairness_diff = model.new_int_var(0, scaled_total, "fairness_diff")
         model.add(fairness_diff == max_work - min_work)
-        objective_terms.append(fairness_diff * 5)
+        obj_vars.append(fairness_diff)
+        obj_coefs.append(5)
 
     # SC-04: Job type balance per employee
     for e_id in emp_ids:
@@ -267,7 +292,9 @@ def generate_schedule(
         job_counts = []
         for j in allowed:
             jc = model.new_int_var(0, total_working_dates, f"jc_{e_id}_{j}")
-            model.add(jc == sum(x[e_id, d, j] for d in working_dates))
+            model.add(jc == cp_model.LinearExpr.sum(
+                [x[e_id, d, j] for d in working_dates if (e_id, d, j) in x]
+            ))
             job_counts.append(jc)
         # Minimize max - min among job counts
         if len(job_counts) >= 2:
@@ -277,20 +304,16 @@ def generate_schedule(
             model.add_min_equality(min_jc, job_counts)
             jc_diff = model.new_int_var(0, total_working_dates, f"jc_diff_{e_id}")
             model.add(jc_diff == max_jc - min_jc)
-            objective_terms.append(jc_diff * 1)
+            obj_vars.append(jc_diff)
+            obj_coefs.append(1)
 
     # SC-05: Priority cost - prefer lower job_type_id (1=職人, 2=サブ, 3=データ, 4=その他)
+    # SC-06: Prefer full-time employees over dependent (weight 3 per working day)
+    # Both are per-assignment costs, folded into one coefficient per x variable
     priority_weight = 2
-    for e_id in emp_ids:
-        for d in working_dates:
-            for j in all_job_type_ids:
-                objective_terms.append(x[e_id, d, j] * j * priority_weight)
-
-    # SC-06: Prefer full-time employees over dependent
-    for e_id in emp_ids:
-        if emp_type[e_id] == "dependent":
-            for d in working_dates:
-                objective_terms.append(work[e_id, d] * 3)
+    for (e_id, d, j), var in x.items():
+        obj_vars.append(var)
+        obj_coefs.append(j * priority_weight + (3 if emp_type[e_id] == "dependent" else 0))
 
     # SC-07: Avoid same job type on consecutive working days
     for e_id in emp_ids:
@@ -301,26 +324,38 @@ def generate_schedule(
             d1 = working_dates[i]
             d2 = working_dates[i + 1]
             for j in allowed:
+                if (e_id, d1, j) not in x or (e_id, d2, j) not in x:
+                    continue  # Fixed to 0 on one of the days, never consecutive
                 consec = model.new_bool_var(f"consec_{e_id}_{d1}_{j}")
                 model.add(consec >= x[e_id, d1, j] + x[e_id, d2, j] - 1)
-                objective_terms.append(consec * 3)
+                obj_vars.append(consec)
+                obj_coefs.append(3)
 
     # Penalty for requirement shortages (very high weight to prioritize meeting requirements)
-    for sv in shortage_vars:
-        objective_terms.append(sv * 100)
+    obj_vars.extend(shortage_vars)
+    obj_coefs.extend([100] * len(shortage_vars))
 
-    if objective_terms:
-        model.minimize(sum(objective_terms))
+    if obj_vars:
+        model.minimize(cp_model.LinearExpr.weighted_sum(obj_vars, obj_coefs))
+
+    # Warm start: hint the most recent comparable schedule's assignments
+    for key in _hint_assignments(db, month, working_dates):
+        var = x.get(key)
+        if var is not None:
+            model.add_hint(var, 1)
 
     # ---- Solve ----
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = 30.0
+    solver.parameters.num_workers = _NUM_WORKERS
+    for name, value in _SOLVER_TUNING.items():
+        setattr(solver.parameters, name, value)
     status = solver.solve(model)
 
     if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
         reasons = _diagnose_infeasibility(
             emp_ids, emp_names, emp_job_types, emp_full_off, emp_half_off,
-            working_dates, hard_one_jt_ids, all_job_type_ids, db,
+            working_dates, hard_one_jt_ids, all_job_type_ids, jt_name_map,
         )
         if reasons:
             msg = "スケジュールを生成できませんでした。以下の問題が見つかりました:\n" + "\n".join(reasons)
@@ -328,6 +363,13 @@ def generate_schedule(
             msg = "スケジュールを生成できませんでした。制約条件とデータを確認してください。"
         raise ValueError(msg)
 
+    # Job per (staff, working day), read from the solution in one pass over x
+    # (HC-02 allows at most one per day); missing keys are days off
+    assigned: dict[tuple[int, date], int] = {}
+    for (e_id, d, j), var in x.items():
+        if solver.value(var) == 1:
+            assigned[e_id, d] = j
+
     # ---- Save results ----
     schedule = Schedule(target_month=month, status="preview")
     from datetime import datetime
@@ -336,35 +378,13 @@ def generate_schedule(
     db.flush()
 
     assignments = []
+    rows = []
     for e_id in emp_ids:
         for d in all_dates:
-            if is_non_working_day(d):
-                # Off day (weekend/holiday)
-                a = ShiftAssignment(
-                    schedule_id=schedule.id,
-                    employee_id=e_id,
-                    date=d,
-                    job_type_id=None,
-                    work_type="off",
-                    headcount_value=0,
-                )
-                db.add(a)
-                assignments.append({
-                    "employee_id": e_id,
-                    "employee_name": emp_names[e_id],
-                    "date": d.isoformat(),
-                    "job_type_id": None,
-                    "work_type": "off",
-                    "headcount_value": 0,
-                })
-                continue
-
-            assigned_job = None
-            for j in all_job_type_ids:
-                if solver.value(x[e_id, d, j]) == 1:
-                    assigned_job = j
-                    break
-
+            # Off day (weekend/holiday, or not assigned) unless a job was assigned
+            assigned_job = assigned.get((e_id, d))
+            wt = "off"
+            hc = 0
             if assigned_job:
                 # Determine work_type based on half-day off requests
                 half_off_period = emp_half_off[e_id].get(d)
@@ -377,46 +397,38 @@ def generate_schedule(
                 else:
                     wt = "full"
                     hc = 1.0
-                a = ShiftAssignment(
-                    schedule_id=schedule.id,
-                    employee_id=e_id,
-                    date=d,
-                    job_type_id=assigned_job,
-                    work_type=wt,
-                    headcount_value=hc,
-                )
-            else:
-                a = ShiftAssignment(
-                    schedule_id=schedule.id,
-                    employee_id=e_id,
-                    date=d,
-                    job_type_id=None,
-                    work_type="off",
-                    headcount_value=0,
-                )
-            db.add(a)
+            rows.append({
+                "schedule_id": schedule.id,
+                "employee_id": e_id,
+                "date": d,
+                "job_type_id": assigned_job,
+                "work_type": wt,
+                "headcount_value": hc,
+            })
             assignments.append({
                 "employee_id": e_id,
                 "employee_name": emp_names[e_id],
                 "date": d.isoformat(),
                 "job_type_id": assigned_job,
-                "work_type": a.work_type,
-                "headcount_value": a.headcount_value,
+                "work_type": wt,
+                "headcount_value": hc,
             })
 
+    # One executemany INSERT instead of a unit-of-work add() per cell
+    db.execute(insert(ShiftAssignment), rows)
     db.commit()
 
     # Check for violations (account for half-day headcount)
     dow_names = ["月", "火", "水", "木", "金", "土", "日"]
-    jt_name_map = {jt.id: jt.name for jt in db.query(JobType).all()}
-    for d in working_dates:
+    for d_idx, d in enumerate(working_dates):
         if d not in daily_reqs:
             continue
         for j, req_count in daily_reqs[d].items():
+            # Only qualified staff can have been assigned; the solved model is left untouched
             actual = sum(
-                emp_hc_factor[e_id].get(d, 2) / 2
-                for e_id in emp_ids
-                if solver.value(x.get((e_id, d, j), model.new_constant(0))) == 1
+                hc_factor[e_id][d_idx] / 2
+                for e_id in job_to_emps.get(j, ())
+                if assigned.get((e_id, d)) == j
             )
             if actual < req_count:
                 jt_name = jt_name_map.get(j, f"職種{j}")
@@ -431,15 +443,44 @@ def generate_schedule(
     return schedule.id, assignments, violations
 
 
+def _hint_assignments(db: Session, month: str, working_dates) -> set[tuple[int, date, int]]:
+    """
+    (employee_id, date, job_type_id) worked in the latest schedule for this month
+    (a regeneration) or, failing that, for the previous month.
+
+    Previous-month dates map to the same weekday occurrence (e.g. 2nd Tuesday) of
+    this month; dates without a working-day counterpart are dropped.
+    """
+    year, mon = map(int, month.split("-"))
+    prev_month = f"{year - 1}-12" if mon == 1 else f"{year}-{mon - 1:02d}"
+    source = db.execute(
+        select(Schedule.id, Schedule.target_month)
+        .where(Schedule.target_month.in_([month, prev_month]))
+        .order_by(Schedule.target_month == month, Schedule.id)
+    ).all()
+    if not source:
+        return set()
+    schedule_id = source[-1][0]
+
+    by_slot = {(d.weekday(), (d.day - 1) // 7): d for d in working_dates}
+    hints = set()
+    for e_id, d, j in db.execute(
+        select(ShiftAssignment.employee_id, ShiftAssignment.date, ShiftAssignment.job_type_id)
+        .where(ShiftAssignment.schedule_id == schedule_id, ShiftAssignment.job_type_id.is_not(None))
+    ):
+        target = by_slot.get((d.weekday(), (d.day - 1) // 7))
+        if target is not None:
+            hints.add((e_id, target, j))
+    return hints
+
+
 def _diagnose_infeasibility(
     emp_ids, emp_names, emp_job_types, emp_full_off, emp_half_off,
-    working_dates, hard_one_jt_ids, all_job_type_ids, db,
+    working_dates, hard_one_jt_ids, all_job_type_ids, jt_name_map,
 ) -> list[str]:
     """ソルバー失敗時の原因を診断し、日本語メッセージのリストを返す。"""
-    from database import JobType
     reasons = []
     dow_names = ["月", "火", "水", "木", "金", "土", "日"]
-    jt_name_map = {jt.id: jt.name for jt in db.query(JobType).all()}
 
     # チェック1: HC-06 — 職人/サブ職人が配置不可能な日
     for j in hard_one_jt_ids:
@@ -503,8 +544,8 @@ def _diagnose_infeasibility(
 
 
 def _apply_extra_constraint(
-    model, x, work, constraint, emp_ids, emp_names,
-    working_dates, all_job_type_ids, emp_job_types, db
+    model, x, constraint, emp_ids, emp_names,
+    working_dates, all_job_type_ids, emp_job_types, jt_name_map
 ):
     """Apply an extra constraint from NLP modification."""
     action = constraint.get("action")
@@ -521,14 +562,10 @@ def _apply_extra_constraint(
     if target_emp is None:
         return
 
-    # Find job type id
-    from database import JobType
-    from sqlalchemy.orm import Session
+    # Find job type id (names were loaded once by the caller)
     target_jt = None
-    # We need to look up job type by name - use a simple approach
     for j in all_job_type_ids:
-        jt = db.query(JobType).filter(JobType.id == j).first()
-        if jt and jt.name == job_type_name:
+        if jt_name_map.get(j) == job_type_name:
             target_jt = j
             break
 
@@ -537,7 +574,9 @@ def _apply_extra_constraint(
 
     # Count of job_type assignments for employee
     jt_count = model.new_int_var(0, len(working_dates), f"nlp_jc_{target_emp}_{target_jt}")
-    model.add(jt_count == sum(x[target_emp, d, target_jt] for d in working_dates))
+    model.add(jt_count == sum(
+        x[target_emp, d, target_jt] for d in working_dates if (target_emp, d, target_jt) in x
+    ))
 
     if action == "increase" and amount:
         # Current approximate count + amount